@@ -0,0 +1,156 @@
+from bisect import bisect_right, insort
+import threading
+import time
+
+from records import STATUS_CODES
+
+
+QUANTILES = (0.5, 0.9, 0.99)
+REVIEWING = STATUS_CODES['reviewing']
+VERDICTS = {
+    STATUS_CODES['approved']: 'approved',
+    STATUS_CODES['rejected']: 'rejected',
+}
+
+
+class P2Quantile:
+    """Streaming estimate of a quantile in constant memory.
+
+    The P-square algorithm of Jain and Chlamtac keeps five markers: the
+    minimum, the maximum, the quantile itself and two points between them,
+    and moves them along a parabola as observations arrive.
+    """
+
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments',
+                 'count')
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        heights = self.heights
+        if len(heights) < 5:
+            insort(heights, value)
+            return
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(heights, value) - 1
+        positions = self.positions
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self.desired[index] += self.increments[index]
+        for index in range(1, 4):
+            self.adjust(index)
+
+    def adjust(self, index):
+        """Move the marker one position towards its desired position."""
+        heights = self.heights
+        positions = self.positions
+        offset = self.desired[index] - positions[index]
+        if not (
+            offset >= 1 and positions[index + 1] - positions[index] > 1
+            or offset <= -1 and positions[index - 1] - positions[index] < -1
+        ):
+            return
+        step = 1 if offset > 0 else -1
+        height = self.parabolic(index, step)
+        if not heights[index - 1] < height < heights[index + 1]:
+            height = heights[index] + step * (
+                heights[index + step] - heights[index]
+            ) / (positions[index + step] - positions[index])
+        heights[index] = height
+        positions[index] += step
+
+    def parabolic(self, index, step):
+        heights = self.heights
+        positions = self.positions
+        below = positions[index] - positions[index - 1]
+        above = positions[index + 1] - positions[index]
+        return heights[index] + step / (below + above) * (
+            (below + step) * (heights[index + 1] - heights[index]) / above
+            + (above - step) * (heights[index] - heights[index - 1]) / below
+        )
+
+    def value(self):
+        """Return the estimate, or None before the first observation."""
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            rank = round(self.p * (len(self.heights) - 1))
+            return self.heights[rank]
+        return self.heights[2]
+
+
+class ReviewAnalytics:
+    """Time works spend in review, computed from the detected transitions.
+
+    The clock of a work starts when it is seen entering `reviewing` and
+    stops at the verdict. Durations feed the quantile sketches, so memory
+    grows only with the number of works under review at the moment.
+    Works already under review when their subscription is polled for the
+    first time are counted but not timed: when they were sent is unknown.
+    """
+
+    def __init__(self, quantiles=QUANTILES):
+        self.sketches = {p: P2Quantile(p) for p in quantiles}
+        self.started = {}
+        self.submitted = 0
+        self.verdicts = dict.fromkeys(VERDICTS.values(), 0)
+        self.timed = 0
+        self.total_time = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, subscription, transitions, now=None, snapshot=False):
+        """Take the (homework, old, new) transitions of a subscription.
+
+        `snapshot` marks the first answer for the subscription, whose works
+        were not seen changing.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for homework, _, status in transitions:
+                key = (subscription, homework)
+                if status == REVIEWING:
+                    self.submitted += 1
+                    if not snapshot:
+                        self.started[key] = now
+                    continue
+                started = self.started.pop(key, None)
+                verdict = VERDICTS.get(status)
+                if verdict is None:
+                    continue
+                self.verdicts[verdict] += 1
+                if started is not None:
+                    self.add(now - started)
+
+    def add(self, duration):
+        self.timed += 1
+        self.total_time += duration
+        for sketch in self.sketches.values():
+            sketch.add(duration)
+
+    def report(self):
+        """Return the counters and the time-in-review quantiles."""
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'in_review': len(self.started),
+                **self.verdicts,
+                'timed': self.timed,
+                'mean': self.total_time / self.timed if self.timed else None,
+                'quantiles': {
+                    p: sketch.value() for p, sketch in self.sketches.items()
+                },
+            }
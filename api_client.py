@@ -0,0 +1,68 @@
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import cap_timeout
+from replay import RecordingClient, ReplayClient
+
+
+logger = logging.getLogger(__name__)
+
+API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 50))
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', 3.05))
+API_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', 30))
+API_CAPTURE_MODE = os.getenv('API_CAPTURE_MODE')
+API_CAPTURE_FILE = os.getenv('API_CAPTURE_FILE', 'capture.jsonl.gz')
+API_REPLAY_SPEED = float(os.getenv('API_REPLAY_SPEED', 1))
+
+
+class PracticumClient:
+    """Keep-alive HTTP client for the Practicum API.
+
+    The client owns a pooled session, so consecutive polls reuse the open
+    TCP/TLS connections to the endpoint instead of reconnecting every time.
+    """
+
+    def __init__(self, pool_size=API_POOL_SIZE,
+                 connect_timeout=API_CONNECT_TIMEOUT,
+                 read_timeout=API_READ_TIMEOUT):
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url, **kwargs):
+        """Send a GET request through the pooled session.
+
+        The timeouts are shortened to what is left of the current deadline.
+        """
+        kwargs['timeout'] = cap_timeout(
+            kwargs.get('timeout', self.timeout), 'get_api_answer'
+        )
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        """Close every pooled connection."""
+        self.session.close()
+
+
+def create_client(mode=API_CAPTURE_MODE, path=API_CAPTURE_FILE,
+                  speed=API_REPLAY_SPEED):
+    """The function creates the API client for the capture mode.
+
+    `record` wraps the pooled client so that every exchange is written to
+    the capture file, `replay` answers from that file instead of the
+    network; anything else gives the plain pooled client.
+    """
+    if mode == 'replay':
+        return ReplayClient(path, speed=speed)
+    client = PracticumClient()
+    if mode == 'record':
+        return RecordingClient(client, path)
+    return client
@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('dotenv', 'requests', 'telegram', 'urllib3')
+
+
+def import_times(module, cwd=None):
+    """The function imports the module in a fresh interpreter.
+
+    Returns the `-X importtime` entries as a dict mapping every imported
+    module to its self and cumulative import time in microseconds.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    for name in ('PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID'):
+        env.pop(name, None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd or ROOT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def heavy_imports(times):
+    """The function lists the heavy packages among the imported modules."""
+    return sorted({
+        name.split('.')[0] for name in times
+        if name.split('.')[0] in HEAVY_MODULES
+    })
+
+
+def run(args):
+    """The function measures the import of the module and returns a report."""
+    samples = [import_times(args.module) for _ in range(args.runs)]
+    totals = [times[args.module][1] for times in samples]
+    slowest = sorted(
+        samples[-1].items(), key=lambda item: item[1][0], reverse=True
+    )[:args.top]
+    return {
+        'module': args.module,
+        'runs': args.runs,
+        'median_ms': round(statistics.median(totals) / 1000, 3),
+        'min_ms': round(min(totals) / 1000, 3),
+        'modules': len(samples[-1]),
+        'heavy_imports': heavy_imports(samples[-1]),
+        'slowest_self_ms': {
+            name: round(own / 1000, 3) for name, (own, _) in slowest
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure how long importing a module of the bot takes.'
+    )
+    parser.add_argument('--module', default='homework')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10,
+                        help='how many of the slowest imports to show')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+        return
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        print(f'{key:<{width}}  {value}')
+
+
+if __name__ == '__main__':
+    main()
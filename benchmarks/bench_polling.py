@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine  # noqa: E402
+import homework  # noqa: E402
+from dispatcher import TelegramDispatcher  # noqa: E402
+from hedging import Hedger  # noqa: E402
+from records import bytes_per_subscription  # noqa: E402
+from scheduler import AdaptiveSchedule  # noqa: E402
+from state import StateStore  # noqa: E402
+from stubs import PracticumStub, TelegramStub  # noqa: E402
+
+
+class BenchmarkEngine(engine.PollingEngine):
+    """Polling engine that records the latency of every poll."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    async def poll(self, subscription):
+        started = time.perf_counter()
+        await super().poll(subscription)
+        self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    """The function returns the value below which `fraction` of values lie."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def max_rss_kib():
+    """The function returns the peak resident set size in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(args):
+    """The function runs the engine against the stubs and returns a report."""
+    practicum = PracticumStub(
+        latency=args.api_latency,
+        error_rate=args.api_error_rate,
+        homeworks=args.homeworks,
+        change_rate=args.change_rate,
+        stall_rate=args.api_stall_rate,
+        stall_latency=args.api_stall_latency,
+    ).start()
+    telegram = TelegramStub(
+        latency=args.telegram_latency,
+        error_rate=args.telegram_error_rate,
+    ).start()
+    homework.ENDPOINT = practicum.url + '/api/user_api/homework_statuses/'
+    bot = engine.make_bot('123456:benchmark', base_url=telegram.url + '/bot')
+    dispatcher = TelegramDispatcher(
+        bot, global_rate=args.telegram_rate, chat_rate=args.telegram_rate
+    )
+    schedule = AdaptiveSchedule(
+        retry_time=args.interval,
+        reviewing_retry_time=args.interval,
+        idle_retry_time=args.interval,
+        error_retry_time=args.interval,
+        max_error_retry_time=args.interval,
+        jitter=0,
+    )
+    workdir = tempfile.TemporaryDirectory()
+    store = StateStore(os.path.join(workdir.name, 'state.sqlite3'))
+    rss_before = max_rss_kib()
+    subscriptions = [
+        engine.Subscription(f'token-{index}', index)
+        for index in range(args.subscriptions)
+    ]
+    polling = BenchmarkEngine(
+        bot,
+        subscriptions,
+        concurrency=args.concurrency,
+        schedule=schedule,
+        store=store,
+        dispatcher=dispatcher,
+        streaming=args.stream,
+        hedger=Hedger(rate=args.hedge_rate) if args.hedge_rate else None,
+    )
+
+    async def run_for_duration():
+        try:
+            await asyncio.wait_for(polling.run(), args.duration)
+        except asyncio.TimeoutError:
+            pass
+
+    dispatcher.start()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    asyncio.run(run_for_duration())
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    rss_after = max_rss_kib()
+    dispatcher.stop(timeout=5)
+    store.close()
+    workdir.cleanup()
+    practicum.stop()
+    telegram.stop()
+    latencies = polling.latencies
+    return {
+        'subscriptions': args.subscriptions,
+        'seconds': round(elapsed, 3),
+        'polls': len(latencies),
+        'polls_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3)
+        if latencies else 0.0,
+        'api_requests': practicum.requests,
+        'api_errors': practicum.errors,
+        'messages': telegram.requests,
+        'cpu_ms_per_poll': round(cpu / max(len(latencies), 1) * 1000, 3),
+        'cpu_ms_per_subscription': round(
+            cpu / args.subscriptions * 1000, 3
+        ),
+        'rss_kib_per_subscription': round(
+            (rss_after - rss_before) / args.subscriptions, 3
+        ),
+        'peak_rss_kib': rss_after,
+        'state_bytes_per_subscription': round(
+            bytes_per_subscription(subscriptions)
+        ),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the polling engine against local stub servers.'
+    )
+    parser.add_argument('--subscriptions', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help='seconds between polls of one subscription')
+    parser.add_argument('--homeworks', type=int, default=5,
+                        help='homeworks in every API answer')
+    parser.add_argument('--change-rate', type=float, default=0.1,
+                        help='probability that an answer has a new status')
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    parser.add_argument('--api-error-rate', type=float, default=0.0)
+    parser.add_argument('--api-stall-rate', type=float, default=0.0,
+                        help='share of API requests that stall')
+    parser.add_argument('--api-stall-latency', type=float, default=1.0,
+                        help='seconds a stalled API request takes more')
+    parser.add_argument('--hedge-rate', type=float, default=0.0,
+                        help='hedged API requests per second, 0 to disable')
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-rate', type=float, default=1000)
+    parser.add_argument('--stream', action='store_true',
+                        help='parse the answers incrementally')
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report))
+        return
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        print(f'{key:<{width}}  {value}')
+
+
+if __name__ == '__main__':
+    main()
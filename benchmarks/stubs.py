@@ -0,0 +1,164 @@
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+
+
+STATUSES = ('reviewing', 'approved', 'rejected')
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded HTTP server with latency and error injection."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, latency=0.0, error_rate=0.0):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.serve_forever, name=handler.__name__, daemon=True
+        )
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self):
+        """Count a request and return whether it should fail."""
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            self.errors += failed
+        return failed
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PracticumHandler(StubHandler):
+    """Answers homework_statuses requests."""
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.stall_rate:
+            time.sleep(server.stall_latency)
+        if server.count():
+            self.reply(HTTPStatus.INTERNAL_SERVER_ERROR, b'{}')
+            return
+        if not self.headers.get('Authorization', '').startswith('OAuth '):
+            self.reply(HTTPStatus.UNAUTHORIZED, b'{}')
+            return
+        self.reply(HTTPStatus.OK, server.answer(self.headers['Authorization']))
+
+
+class PracticumStub(StubServer):
+    """Homework_statuses endpoint with `homeworks` works per token.
+
+    Every request changes the status of one work of the token with the
+    probability `change_rate` and stalls for `stall_latency` more seconds
+    with the probability `stall_rate`.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, homeworks=1,
+                 change_rate=0.0, name_size=16, stall_rate=0.0,
+                 stall_latency=0.0):
+        super().__init__(PracticumHandler, latency, error_rate)
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self.homeworks = homeworks
+        self.change_rate = change_rate
+        self.name_size = name_size
+        self.states = {}
+
+    def answer(self, token):
+        with self.lock:
+            statuses = self.states.get(token)
+            if statuses is None:
+                statuses = self.states[token] = ['reviewing'] * self.homeworks
+            if self.homeworks and random.random() < self.change_rate:
+                statuses[random.randrange(self.homeworks)] = random.choice(
+                    STATUSES
+                )
+            statuses = list(statuses)
+        homeworks = [
+            {
+                'id': index,
+                'status': status,
+                'homework_name': f'hw{index}'.ljust(self.name_size, '_'),
+                'reviewer_comment': '',
+                'date_updated': '2020-02-13T14:40:57Z',
+                'lesson_name': 'Project',
+            }
+            for index, status in enumerate(statuses)
+        ]
+        return json.dumps({
+            'homeworks': homeworks,
+            'current_date': int(time.time()),
+        }).encode()
+
+
+class TelegramHandler(StubHandler):
+    """Answers sendMessage calls."""
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if server.latency:
+            time.sleep(server.latency)
+        if server.count():
+            self.reply(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                json.dumps({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': 'Too Many Requests',
+                    'parameters': {'retry_after': 1},
+                }).encode(),
+            )
+            return
+        self.reply(HTTPStatus.OK, json.dumps({
+            'ok': True,
+            'result': {
+                'message_id': server.requests,
+                'date': int(time.time()),
+                'chat': {'id': payload.get('chat_id'), 'type': 'private'},
+                'text': payload.get('text'),
+            },
+        }).encode())
+
+
+class TelegramStub(StubServer):
+    """Telegram Bot API that accepts every message."""
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        super().__init__(TelegramHandler, latency, error_rate)
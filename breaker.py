@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from exceptions import ServerError
+
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RECOVERY_TIME = float(os.getenv('BREAKER_RECOVERY_TIME', 60))
+BREAKER_PROBES = int(os.getenv('BREAKER_PROBES', 1))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def is_outage(error):
+    """The function checks whether the error means the API is unavailable.
+
+    Network failures and 5xx answers count; answers such as 401 for a bad
+    token concern a single user and do not.
+    """
+    while error is not None:
+        if isinstance(error, (requests.RequestException, ServerError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+class CircuitBreaker:
+    """Stops requests to an unavailable endpoint.
+
+    After `failure_threshold` outage errors in a row the circuit opens and
+    `allow()` refuses every request for `recovery_time` seconds. Then it is
+    half-open: up to `probes` requests test the endpoint, the first success
+    closes the circuit and a failure opens it again. `on_change` is called
+    with the new state on every transition.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 recovery_time=BREAKER_RECOVERY_TIME, probes=BREAKER_PROBES,
+                 on_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.probes = probes
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probes_in_flight = 0
+        self.lock = threading.Lock()
+
+    def transition(self, state):
+        """Switch to the state; return the callback to run, if any."""
+        logger.warning('Circuit %s is %s', self.name, state)
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        return self.on_change
+
+    def notify(self, callback, state):
+        if callback is not None:
+            callback(self, state)
+
+    def allow(self, now=None):
+        """Check whether a request may be sent now."""
+        now = time.monotonic() if now is None else now
+        callback = None
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if now - self.opened_at < self.recovery_time:
+                    return False
+                callback = self.transition(HALF_OPEN)
+            allowed = self.probes_in_flight < self.probes
+            if allowed:
+                self.probes_in_flight += 1
+        self.notify(callback, HALF_OPEN)
+        return allowed
+
+    def record_success(self):
+        callback = None
+        with self.lock:
+            self.failures = 0
+            if self.state != CLOSED:
+                callback = self.transition(CLOSED)
+        self.notify(callback, CLOSED)
+
+    def release(self):
+        """Give back the permission for a request that was never sent."""
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes_in_flight:
+                self.probes_in_flight -= 1
+
+    def record_failure(self):
+        callback = None
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED
+                and self.failures >= self.failure_threshold
+            ):
+                callback = self.transition(OPEN)
+        self.notify(callback, OPEN)
+
+
+BREAKERS = {}
+BREAKERS_LOCK = threading.Lock()
+
+
+def breaker_for(endpoint, **kwargs):
+    """The function returns the circuit breaker shared by the endpoint."""
+    with BREAKERS_LOCK:
+        breaker = BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = BREAKERS[endpoint] = CircuitBreaker(endpoint, **kwargs)
+        return breaker
@@ -0,0 +1,333 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import os
+import threading
+import time
+
+import telegram
+
+from breaker import breaker_for, is_outage
+from deadline import POLL_DEADLINE, deadline
+from exceptions import CircuitOpen, DeadlineExceeded
+from homework import (
+    ENDPOINT,
+    HOMEWORK_VERDICTS,
+    check_response,
+    fetch_api_answer,
+)
+from records import compact_homeworks
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_TTL = float(os.getenv('STATUS_CACHE_TTL', 300))
+STATUS_LIMIT = 5
+COMMAND_WORKERS = 4
+LONG_POLLING_TIMEOUT = 30
+ERROR_RETRY_TIME = 5
+COMMANDS_LEASE = 'commands'
+
+
+class SingleFlight:
+    """Runs at most one call per key; concurrent callers share its result."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(func(*args))
+        except Exception as error:
+            future.set_exception(error)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return future.result()
+
+
+class StatusCache:
+    """Latest homeworks of every token as compact records.
+
+    The polling engine keeps the entries of its subscriptions current:
+    every poll renews an entry and every answer with changes is merged
+    into it, so only tokens nobody polls are fetched for /status.
+    """
+
+    def __init__(self, ttl=STATUS_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, token, now=None):
+        """Return the cached homeworks or None if they are stale."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(token)
+        if entry is None or now - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def put(self, token, homeworks, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.entries[token] = (now, homeworks)
+
+    def update(self, token, records, snapshot=False, now=None):
+        """Merge the homeworks of a poll, latest first, into the entry.
+
+        A `snapshot` is the whole history and replaces the entry; other
+        answers hold only the changed homeworks and need an entry to
+        merge into.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(token)
+            if not snapshot:
+                if entry is None:
+                    return
+                names = {record.name for record in records}
+                records = records + [
+                    record for record in entry[1] if record.name not in names
+                ]
+            self.entries[token] = (now, records)
+
+    def touch(self, token, now=None):
+        """Renew the entry after a poll has found nothing new."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is not None:
+                self.entries[token] = (now, entry[1])
+
+    def invalidate(self, token):
+        """Forget the entry of the token after its statuses changed."""
+        with self.lock:
+            self.entries.pop(token, None)
+
+
+def render_status(homeworks, limit=STATUS_LIMIT):
+    """The function renders the answer to the /status command."""
+    if not homeworks:
+        return 'There is no homework'
+    lines = [
+        '{name}: {verdict}'.format(
+            name=homework.name,
+            verdict=HOMEWORK_VERDICTS.get(
+                homework.status_name, homework.status_name
+            ),
+        )
+        for homework in homeworks[:limit]
+    ]
+    return '\n'.join(lines)
+
+
+def format_duration(seconds):
+    """The function renders a duration as hours and minutes."""
+    minutes = round(seconds / 60)
+    return '{}h {:02d}m'.format(*divmod(minutes, 60))
+
+
+def render_report(report):
+    """The function renders the answer to the /report command."""
+    lines = [
+        'Sent for review: {submitted}, under review: {in_review}'.format(
+            **report
+        ),
+        'Approved: {approved}, rejected: {rejected}'.format(**report),
+    ]
+    if not report['timed']:
+        lines.append('No review has been timed yet')
+        return '\n'.join(lines)
+    lines.append('Time in review of {timed} works: mean {mean}'.format(
+        timed=report['timed'], mean=format_duration(report['mean'])
+    ))
+    lines.extend(
+        'p{:g}: {}'.format(p * 100, format_duration(value))
+        for p, value in report['quantiles'].items()
+    )
+    return '\n'.join(lines)
+
+
+class StatusService:
+    """Answers status questions from the cache, refreshing it at most once.
+
+    A stale or missing entry is refreshed with a full-history request; all
+    callers asking about the same token meanwhile wait for that request
+    instead of sending their own. The request goes through the circuit
+    breaker of the endpoint and has the deadline of a poll.
+    """
+
+    def __init__(self, cache=None, breaker=None):
+        self.cache = cache or StatusCache()
+        self.breaker = breaker or breaker_for(ENDPOINT)
+        self.flight = SingleFlight()
+
+    def refresh(self, token):
+        if not self.breaker.allow():
+            raise CircuitOpen(f'Circuit {self.breaker.name} is open')
+        try:
+            with deadline(POLL_DEADLINE):
+                answer = fetch_api_answer(token, 0)
+        except Exception as error:
+            if isinstance(error, DeadlineExceeded) and not error.__cause__:
+                self.breaker.release()
+            elif is_outage(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        homeworks = compact_homeworks(check_response(answer))
+        self.cache.put(token, homeworks)
+        return homeworks
+
+    def homeworks(self, token):
+        homeworks = self.cache.get(token)
+        if homeworks is None:
+            homeworks = self.flight.do(token, self.refresh, token)
+        return homeworks
+
+
+class CommandListener:
+    """Receives bot commands with getUpdates long polling.
+
+    Telegram lets a single client call getUpdates per bot, so replicas
+    sharing a lease store pass a `lease` keeper and only the holder of the
+    listener lease polls; a long poll is kept shorter than its renewal.
+    """
+
+    def __init__(self, bot, subscriptions, dispatcher, service=None,
+                 analytics=None, lease=None):
+        self.bot = bot
+        self.analytics = analytics
+        self.dispatcher = dispatcher
+        self.service = service or StatusService()
+        self.lease = lease
+        self.polling_timeout = LONG_POLLING_TIMEOUT
+        if lease is not None:
+            self.polling_timeout = max(
+                min(LONG_POLLING_TIMEOUT, int(lease.renew_interval)), 1
+            )
+        self.tokens = {}
+        self.set_roster(subscriptions)
+        self.offset = None
+        self.stopped = threading.Event()
+        self.executor = ThreadPoolExecutor(
+            max_workers=COMMAND_WORKERS, thread_name_prefix='command'
+        )
+        self.thread = threading.Thread(
+            target=self.run, name='command-listener', daemon=True
+        )
+
+    def set_roster(self, subscriptions):
+        """Replace the subscriptions whose chats may ask for statuses."""
+        tokens = {}
+        for subscription in subscriptions:
+            tokens.setdefault(str(subscription.chat_id), []).append(
+                subscription.practicum_token
+            )
+        self.tokens = tokens
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.executor.shutdown(wait=False)
+
+    def run(self):
+        """Fetch updates until stopped."""
+        while not self.stopped.is_set():
+            if not self.holds_lease():
+                self.stopped.wait(self.lease.renew_interval)
+                continue
+            try:
+                updates = self.bot.get_updates(
+                    offset=self.offset,
+                    timeout=self.polling_timeout,
+                    allowed_updates=['message'],
+                )
+            except telegram.error.TelegramError as error:
+                logger.error('Failed to get updates: %s', error)
+                self.stopped.wait(ERROR_RETRY_TIME)
+                continue
+            for update in updates:
+                self.offset = update.update_id + 1
+                self.handle(update)
+        self.release_lease()
+
+    def holds_lease(self):
+        """Renew the listener lease; only its holder may get updates."""
+        if self.lease is None:
+            return True
+        try:
+            if self.lease.refresh([COMMANDS_LEASE]):
+                logger.info('This replica now answers the bot commands')
+        except Exception as error:
+            logger.error('Failed to renew the listener lease: %s', error)
+        return self.lease.holds(COMMANDS_LEASE)
+
+    def release_lease(self):
+        if self.lease is None:
+            return
+        try:
+            self.lease.release()
+        except Exception as error:
+            logger.debug('Failed to release the listener lease: %s', error)
+
+    def handle(self, update):
+        """Dispatch a command to the worker threads."""
+        message = update.message
+        if message is None or not message.text:
+            return
+        command = message.text.split()[0].split('@')[0]
+        if command == '/status':
+            self.executor.submit(self.answer_status, message.chat_id)
+        elif command == '/report':
+            self.executor.submit(self.answer_report, message.chat_id)
+
+    def answer_status(self, chat_id):
+        """Reply to /status with the cached statuses of the chat."""
+        tokens = self.tokens.get(str(chat_id))
+        if not tokens:
+            self.dispatcher.submit(chat_id, 'You are not subscribed')
+            return
+        try:
+            answers = [
+                render_status(self.service.homeworks(token))
+                for token in tokens
+            ]
+        except Exception as error:
+            logger.error('Failed to answer /status: %s', error)
+            answers = ['The status is not available now, try again later']
+        self.dispatcher.submit(chat_id, '\n\n'.join(answers))
+
+    def answer_report(self, chat_id):
+        """Reply to /report with the review time of all subscriptions.
+
+        Lease replicas do not share their analytics, so a replica can only
+        report the subscriptions it polls, and says so.
+        """
+        if str(chat_id) not in self.tokens:
+            self.dispatcher.submit(chat_id, 'You are not subscribed')
+            return
+        if self.analytics is None:
+            self.dispatcher.submit(
+                chat_id, 'Review times are not collected by this process'
+            )
+            return
+        answer = render_report(self.analytics.report())
+        if self.lease is not None:
+            answer += (
+                '\nOnly the subscriptions polled by this replica '
+                'are counted'
+            )
+        self.dispatcher.submit(chat_id, answer)
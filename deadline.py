@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import time
+
+from exceptions import DeadlineExceeded
+from metrics import DEADLINE_OVERRUNS
+
+
+POLL_DEADLINE = float(os.getenv('POLL_DEADLINE', 60))
+
+current_deadline = ContextVar('current_deadline', default=None)
+
+
+class Deadline:
+    """Point in time by which a polling iteration has to be finished."""
+
+    __slots__ = ('budget', 'expires')
+
+    def __init__(self, budget, now=None):
+        now = time.monotonic() if now is None else now
+        self.budget = budget
+        self.expires = now + budget
+
+    def remaining(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.expires - now
+
+    def check(self, stage, now=None):
+        """Return the time left; raise DeadlineExceeded if there is none."""
+        remaining = self.remaining(now)
+        if remaining <= 0:
+            DEADLINE_OVERRUNS.inc(stage=stage)
+            raise DeadlineExceeded(
+                f'The {self.budget}s deadline has expired before {stage}'
+            )
+        return remaining
+
+
+@contextmanager
+def deadline(budget=POLL_DEADLINE):
+    """Run the block with a deadline `budget` seconds from now.
+
+    The deadline follows the block into coroutines and, through
+    `contextvars.copy_context()`, into the threads that run its calls.
+    """
+    token = current_deadline.set(Deadline(budget))
+    try:
+        yield current_deadline.get()
+    finally:
+        current_deadline.reset(token)
+
+
+def check_deadline(stage):
+    """The function raises DeadlineExceeded if the deadline has expired."""
+    current = current_deadline.get()
+    if current is not None:
+        current.check(stage)
+
+
+def cap_timeout(timeout, stage):
+    """The function shortens the timeout of a call to the time left.
+
+    `timeout` is None, a number or a (connect, read) pair as in requests.
+    Without a deadline it is returned as it is.
+    """
+    current = current_deadline.get()
+    if current is None:
+        return timeout
+    remaining = current.check(stage)
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(min(part, remaining) for part in timeout)
+    return min(timeout, remaining)
+
+
+def expired(stage):
+    """The function tells whether a failure was caused by the deadline.
+
+    A call whose timeout was shortened fails with its own timeout error;
+    if no time is left by then, the overrun is counted for the stage.
+    """
+    current = current_deadline.get()
+    if current is None or current.remaining() > 0:
+        return False
+    DEADLINE_OVERRUNS.inc(stage=stage)
+    return True
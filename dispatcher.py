@@ -0,0 +1,283 @@
+from collections import Counter, deque
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+import telegram
+
+from deadline import cap_timeout, expired
+from exceptions import DeadlineExceeded
+from homework import send_chat_message
+
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_SENDERS = int(os.getenv('TELEGRAM_SENDERS', 4))
+TELEGRAM_QUEUE_SIZE = int(os.getenv('TELEGRAM_QUEUE_SIZE', 1000))
+DRAIN_TIMEOUT = 30
+WAKE_UP_TIME = 0.1
+
+
+class TokenBucket:
+    """Thread-safe token bucket."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.burst = capacity
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.rate,
+        )
+        self.updated = now
+
+    def consume(self, now=None):
+        """Take a token and return 0, or return how long to wait for one."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        """Return a token taken by `consume`."""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def set_rate(self, rate, now=None):
+        """Change the rate; the tokens saved so far are kept."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.refill(now)
+            self.rate = rate
+            self.capacity = self.burst or max(rate, 1)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class SenderWorker:
+    """Delivers the messages of a share of chats in its own thread."""
+
+    def __init__(self, dispatcher, index, queue_size):
+        self.dispatcher = dispatcher
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.chat_buckets = {}
+        self.pending = {}
+        self.ready = []
+        self.sequence = itertools.count()
+        self.thread = threading.Thread(
+            target=self.run, name=f'telegram-sender-{index}', daemon=True
+        )
+
+    @property
+    def backlog(self):
+        """Number of messages waiting in this worker."""
+        return self.inbox.qsize() + sum(
+            len(messages) for messages in list(self.pending.values())
+        )
+
+    def schedule(self, chat_id, at):
+        """Mark the chat as ready to send at the given time."""
+        heapq.heappush(self.ready, (at, next(self.sequence), chat_id))
+
+    def accept(self, item, now):
+        """Add a submitted message to the pending messages of its chat."""
+        chat_id, message = item
+        messages = self.pending.setdefault(chat_id, deque())
+        messages.append(message)
+        if len(messages) == 1:
+            self.schedule(chat_id, now)
+
+    def drained(self):
+        """Check whether the dispatcher is closed and nothing is left."""
+        return (
+            self.dispatcher.closed.is_set()
+            and not self.pending
+            and self.inbox.empty()
+        )
+
+    def run(self):
+        """Deliver messages until the dispatcher is stopped."""
+        dispatcher = self.dispatcher
+        while not dispatcher.aborted.is_set() and not self.drained():
+            timeout = WAKE_UP_TIME if dispatcher.closed.is_set() else None
+            if self.ready:
+                wait = max(self.ready[0][0] - time.monotonic(), 0)
+                timeout = wait if timeout is None else min(wait, timeout)
+            try:
+                item = self.inbox.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            while item is not None:
+                if item is not dispatcher.WAKE_UP:
+                    self.accept(item, time.monotonic())
+                try:
+                    item = self.inbox.get_nowait()
+                except queue.Empty:
+                    item = None
+            if self.ready and self.ready[0][0] <= time.monotonic():
+                self.deliver_next()
+
+    def deliver_next(self):
+        """Deliver to the first ready chat; an error must not stop us."""
+        _, _, chat_id = heapq.heappop(self.ready)
+        try:
+            self.deliver(chat_id)
+        except Exception as error:
+            logger.exception('Sender failed: %s', error)
+
+    def deliver(self, chat_id):
+        """Send the oldest pending message of the chat if the limits allow."""
+        dispatcher = self.dispatcher
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(
+                dispatcher.chat_rate, capacity=1
+            )
+        now = time.monotonic()
+        wait = max(dispatcher.paused_until - now, 0)
+        if not wait:
+            wait = bucket.consume(now)
+        if not wait:
+            wait = dispatcher.global_bucket.consume(now)
+            if wait:
+                bucket.refund()
+        if wait:
+            self.schedule(chat_id, now + wait)
+            return
+        messages = self.pending[chat_id]
+        try:
+            sent = send_chat_message(dispatcher.bot, chat_id, messages[0])
+        except telegram.error.RetryAfter as error:
+            logger.warning(
+                'Flood control exceeded, retry in %s s', error.retry_after
+            )
+            dispatcher.count('retried')
+            dispatcher.paused_until = time.monotonic() + error.retry_after
+            self.schedule(chat_id, dispatcher.paused_until)
+            return
+        except Exception as error:
+            logger.exception('Failed to send a message: %s', error)
+            sent = False
+        dispatcher.count('delivered' if sent else 'failed')
+        messages.popleft()
+        if messages:
+            self.schedule(chat_id, time.monotonic())
+        else:
+            del self.pending[chat_id]
+
+
+class TelegramDispatcher:
+    """Sends queued messages within Telegram's flood limits.
+
+    Chats are spread over a pool of sender threads, each with a bounded
+    queue, so a slow Telegram round-trip never delays the polling. All
+    senders share a global token bucket, every chat has its own bucket, and
+    `RetryAfter` pauses the whole pool for as long as Telegram asks.
+    """
+
+    WAKE_UP = object()
+
+    def __init__(self, bot, global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_rate=TELEGRAM_CHAT_RATE, senders=TELEGRAM_SENDERS,
+                 queue_size=TELEGRAM_QUEUE_SIZE):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.paused_until = 0
+        self.closed = threading.Event()
+        self.aborted = threading.Event()
+        self.counters = Counter()
+        self.counters_lock = threading.Lock()
+        self.workers = [
+            SenderWorker(self, index, queue_size) for index in range(senders)
+        ]
+
+    def start(self):
+        """Start the sender threads."""
+        for worker in self.workers:
+            worker.thread.start()
+
+    def stop(self, timeout=DRAIN_TIMEOUT):
+        """Deliver what is queued, waiting no longer than `timeout`."""
+        self.closed.set()
+        for worker in self.workers:
+            try:
+                worker.inbox.put_nowait(self.WAKE_UP)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.thread.join(max(deadline - time.monotonic(), 0))
+        self.aborted.set()
+        undelivered = self.backlog
+        if undelivered:
+            logger.warning('%s messages were not delivered', undelivered)
+        logger.info('Telegram dispatcher stopped: %s', self.stats())
+
+    def worker_for(self, chat_id):
+        """Return the worker that owns the chat."""
+        index = zlib.crc32(str(chat_id).encode()) % len(self.workers)
+        return self.workers[index]
+
+    def count(self, name, value=1):
+        """Increase a counter."""
+        with self.counters_lock:
+            self.counters[name] += value
+
+    def offer(self, chat_id, message):
+        """Queue a message without blocking; return False if it is full."""
+        if self.closed.is_set():
+            raise RuntimeError('Telegram dispatcher is stopped')
+        try:
+            self.worker_for(chat_id).inbox.put_nowait((chat_id, message))
+        except queue.Full:
+            self.count('queue_full')
+            return False
+        self.count('submitted')
+        return True
+
+    def submit(self, chat_id, message, timeout=None):
+        """Queue a message, waiting while the queue of its chat is full.
+
+        Within a deadline the wait is limited to the time left.
+        """
+        if self.offer(chat_id, message):
+            return
+        started = time.monotonic()
+        timeout = cap_timeout(timeout, 'send_message')
+        try:
+            self.worker_for(chat_id).inbox.put(
+                (chat_id, message), timeout=timeout
+            )
+        except queue.Full:
+            if expired('send_message'):
+                raise DeadlineExceeded('The send queue is full') from None
+            raise
+        self.count('submitted')
+        self.count('blocked_seconds', time.monotonic() - started)
+
+    @property
+    def backlog(self):
+        """Number of messages waiting in every worker."""
+        return sum(worker.backlog for worker in self.workers)
+
+    def stats(self):
+        """Return the delivery counters and the current backlog."""
+        with self.counters_lock:
+            stats = dict(self.counters)
+        stats['backlog'] = self.backlog
+        return stats
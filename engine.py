@@ -0,0 +1,846 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import hashlib
+from http import HTTPStatus
+import json
+import logging
+import os
+import signal
+import time
+
+import telegram
+from telegram.utils.request import Request
+
+from analytics import ReviewAnalytics
+from breaker import CLOSED, OPEN, breaker_for, is_outage
+from deadline import POLL_DEADLINE, check_deadline, deadline
+from commands import CommandListener, StatusCache, StatusService
+from dispatcher import (
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_SENDERS,
+    TelegramDispatcher,
+)
+from exceptions import (
+    CircuitOpen,
+    DeadlineExceeded,
+    InvalidTokens,
+    LeaseLost,
+    NotForSending,
+)
+from fingerprint import ResponseFingerprint, response_digest
+from hedging import HEDGE_RATE, HEDGE_REQUESTS, Hedger
+import homework
+from history import HISTORY_FILE, TransitionLog
+from homework import (
+    ENDPOINT,
+    check_response,
+    fetch_api_response,
+    parse_status,
+    send_chat_message,
+)
+from leases import (
+    LEASE_STORE,
+    REPLICA_ID,
+    LeaseKeeper,
+    create_lease_store,
+    replica_path,
+)
+from logs import LOG_FILE, setup_logging
+from metrics import (
+    LOOP_LAG,
+    METRICS_PORT,
+    CIRCUIT_OPEN,
+    POLLS,
+    REGISTRY,
+    SEND_BACKLOG,
+    SUBSCRIPTION_BYTES,
+    SUBSCRIPTIONS,
+    start_metrics_server,
+)
+from records import (
+    STATUS_CODES,
+    HomeworkRecord,
+    bytes_per_subscription,
+    compact_homeworks,
+    intern_name,
+)
+from scheduler import AdaptiveSchedule, PollQueue
+from state import STATE_FILE, StateStore
+from streaming import CHUNK_SIZE, HomeworkStream
+
+
+logger = logging.getLogger(__name__)
+
+ROSTER_FILE = os.getenv('ROSTER_FILE')
+POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', 50))
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', '') == '1'
+COMMANDS_ENABLED = os.getenv('COMMANDS_ENABLED', '1') == '1'
+WORKERS = int(os.getenv('WORKERS', 1)) or os.cpu_count()
+OUTAGE_CHAT_ID = os.getenv('OUTAGE_CHAT_ID')
+HISTORY_MAINTAIN_INTERVAL = 60 * 60
+ROSTER_CHECK_INTERVAL = 5
+OUTAGE_MESSAGES = {
+    OPEN: 'The Practicum API is unavailable, polling is suspended',
+    CLOSED: 'The Practicum API is available again',
+}
+
+
+class Subscription:
+    """Polling state of a single (practicum token, chat id) pair.
+
+    `statuses` maps interned homework keys to status codes and
+    `previous_report` is the text of the last message sent, or the kind
+    of the last failure reported.
+    """
+
+    __slots__ = (
+        'practicum_token', 'chat_id', 'current_timestamp', 'previous_report',
+        'statuses', 'fingerprint', 'last_status', 'last_change',
+        'error_count',
+    )
+
+    def __init__(self, practicum_token, chat_id, current_timestamp=0):
+        self.practicum_token = practicum_token
+        self.chat_id = chat_id
+        self.current_timestamp = current_timestamp
+        self.previous_report = None
+        self.statuses = {}
+        self.fingerprint = ResponseFingerprint()
+        self.last_status = None
+        self.last_change = time.monotonic()
+        self.error_count = 0
+
+    def __repr__(self):
+        return f'Subscription(chat_id={self.chat_id!r})'
+
+    @property
+    def key(self):
+        """Stable identifier that does not reveal the token."""
+        return hashlib.sha256(
+            f'{self.practicum_token}:{self.chat_id}'.encode()
+        ).hexdigest()[:32]
+
+
+def homework_key(homework):
+    """The function returns the key of the homework in the status index."""
+    if 'id' in homework:
+        return intern_name(str(homework['id']))
+    if 'homework_name' not in homework:
+        raise KeyError(
+            f'Homework {homework} does not contain such a key homework_name'
+        )
+    return intern_name(homework['homework_name'])
+
+
+def diff_statuses(statuses, homeworks):
+    """The function finds homeworks whose status differs from the index.
+
+    Returns a list of (key, status code, message) tuples; the index itself
+    is left untouched until the notifications are sent.
+    """
+    changes = []
+    for work in homeworks:
+        key = homework_key(work)
+        code = STATUS_CODES.get(work.get('status'))
+        if code is None or statuses.get(key) != code:
+            changes.append((key, code, parse_status(work)))
+    return changes
+
+
+def record_homeworks(homeworks, records):
+    """The function passes the homeworks on, keeping them as records."""
+    for work in homeworks:
+        records.append(HomeworkRecord.from_json(work))
+        yield work
+
+
+def load_roster(path=ROSTER_FILE):
+    """The function loads subscriptions from the roster file.
+
+    The roster is a JSON list of objects with the `practicum_token` and
+    `telegram_chat_id` keys. Without a roster file the single subscription
+    from the environment variables is used.
+    """
+    if not path:
+        return [
+            Subscription(homework.PRACTICUM_TOKEN, homework.TELEGRAM_CHAT_ID)
+        ]
+    with open(path, encoding='utf-8') as roster_file:
+        entries = json.load(roster_file)
+    if not isinstance(entries, list):
+        raise TypeError(f'Roster {path} is not a list')
+    subscriptions = []
+    for entry in entries:
+        for key in ('practicum_token', 'telegram_chat_id'):
+            if not entry.get(key):
+                raise KeyError(f'Roster entry does not contain the key {key}')
+        subscriptions.append(
+            Subscription(entry['practicum_token'], entry['telegram_chat_id'])
+        )
+    logger.info(
+        'Roster %s loaded: %s subscriptions', path, len(subscriptions)
+    )
+    return subscriptions
+
+
+class RosterFile:
+    """Roster file that is loaded again after it has changed."""
+
+    def __init__(self, path=ROSTER_FILE):
+        self.path = path
+        self.mtime = self.stat()
+
+    def stat(self):
+        """Return the modification time of the file, if there is one."""
+        if not self.path:
+            return None
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self, force=False):
+        """Return the subscriptions if the file has changed, else None.
+
+        With `force` the file is loaded even if it looks unchanged. An
+        invalid roster is logged and ignored.
+        """
+        mtime = self.stat()
+        if mtime is None or mtime == self.mtime and not force:
+            return None
+        self.mtime = mtime
+        try:
+            return load_roster(self.path)
+        except Exception as error:
+            logger.error('Roster %s is invalid: %s', self.path, error)
+            return None
+
+
+async def wait_event(event, timeout=None):
+    """The function waits for the event for no longer than the timeout.
+
+    The wait is ended by a timer rather than `asyncio.wait_for()`, which on
+    Python 3.11 may swallow a cancellation that arrives as the wait ends.
+    """
+    timer = None
+    if timeout is not None:
+        timer = asyncio.get_running_loop().call_later(timeout, event.set)
+    try:
+        await event.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+def check_roster(subscriptions):
+    """The function checks that every subscription is complete."""
+    roster_checked = bool(homework.TELEGRAM_TOKEN) and bool(subscriptions)
+    if not homework.TELEGRAM_TOKEN:
+        logger.critical('Environment variable is missing : TELEGRAM_TOKEN')
+    for subscription in subscriptions:
+        if not subscription.practicum_token or not subscription.chat_id:
+            logger.critical('Incomplete subscription: %s', subscription)
+            roster_checked = False
+    return roster_checked
+
+
+class PollingEngine:
+    """Polls the API for every subscription of the roster concurrently."""
+
+    def __init__(self, bot, subscriptions, concurrency=POLL_CONCURRENCY,
+                 schedule=None, store=None, dispatcher=None,
+                 streaming=STREAM_RESPONSES, status_cache=None,
+                 breaker=None, leases=None, history=None, analytics=None,
+                 hedger=None, poll_deadline=POLL_DEADLINE, roster=None,
+                 on_roster=None):
+        self.bot = bot
+        self.roster = roster
+        self.on_roster = on_roster
+        self.reload_forced = False
+        self.reload_requested = None
+        self.poll_deadline = poll_deadline
+        self.hedger = hedger
+        self.history = history
+        self.analytics = analytics
+        self.leases = leases
+        self.breaker = breaker or breaker_for(ENDPOINT)
+        self.breaker.on_change = self.circuit_changed
+        self.outage_announced = False
+        self.status_cache = status_cache
+        self.streaming = streaming
+        self.dispatcher = dispatcher
+        self.subscriptions = list(subscriptions)
+        self.by_key = {
+            subscription.key: subscription
+            for subscription in self.subscriptions
+        }
+        self.concurrency = concurrency
+        self.schedule = schedule or AdaptiveSchedule()
+        self.store = store
+        self.executor = None
+        self.semaphore = None
+        self.queue = None
+        self.wakeup = None
+        self.polls = set()
+
+    async def run(self):
+        """Run the polling loops until cancelled."""
+        # a hedged poll may hold a second thread until its loser returns
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency * (2 if self.hedger else 1)
+        )
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        SUBSCRIPTIONS.set(len(self.subscriptions))
+        if self.store is not None:
+            restored = sum(
+                self.store.load(subscription)
+                for subscription in self.subscriptions
+            )
+            logger.info('State restored for %s subscriptions', restored)
+        size = bytes_per_subscription(self.subscriptions)
+        SUBSCRIPTION_BYTES.set(size)
+        logger.info('A subscription takes %.0f bytes', size)
+        self.queue = PollQueue()
+        self.wakeup = asyncio.Event()
+        if self.leases is None:
+            for subscription in self.subscriptions:
+                self.reschedule(
+                    subscription, self.schedule.first_delay(subscription)
+                )
+        tasks = [self.dispatch()]
+        if self.history is not None:
+            tasks.append(self.keep_history())
+        if self.leases is not None:
+            await self.refresh_leases()
+            tasks.append(self.keep_leases())
+        if self.roster is not None:
+            tasks.append(self.keep_roster())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in list(self.polls):
+                task.cancel()
+            if self.leases is not None:
+                self.leases.release()
+            self.executor.shutdown(wait=False)
+
+    async def dispatch(self):
+        """Start the due polls, no more than `concurrency` at once."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.semaphore.acquire()
+            try:
+                subscription, due = await self.next_due()
+            except BaseException:
+                self.semaphore.release()
+                raise
+            task = loop.create_task(self.watch(subscription, due))
+            self.polls.add(task)
+            task.add_done_callback(self.polls.discard)
+
+    async def next_due(self):
+        """Wait until a subscription is due and take it from the queue."""
+        while True:
+            now = time.monotonic()
+            popped = self.queue.pop_due(now)
+            if popped is not None:
+                return popped
+            due = self.queue.peek()
+            self.wakeup.clear()
+            await wait_event(self.wakeup, None if due is None else due - now)
+
+    async def watch(self, subscription, due):
+        """Poll the subscription once and schedule its next poll.
+
+        The poll has `poll_deadline` seconds; its API and Telegram calls
+        get only the time that is left. A subscription whose lease has
+        been lost leaves the queue until `refresh_leases()` takes it back.
+        """
+        try:
+            if not self.holds(subscription):
+                return
+            LOOP_LAG.observe(max(time.monotonic() - due, 0))
+            with deadline(self.poll_deadline):
+                await self.poll(subscription)
+        finally:
+            self.semaphore.release()
+        if (
+            self.by_key.get(subscription.key) is subscription
+            and self.holds(subscription)
+        ):
+            self.reschedule(
+                subscription, self.schedule.next_delay(subscription)
+            )
+
+    def reschedule(self, subscription, delay):
+        self.queue.push(subscription, time.monotonic() + delay)
+        self.wakeup.set()
+
+    def holds(self, subscription):
+        """Check whether this replica may poll the subscription."""
+        return self.leases is None or self.leases.holds(subscription.key)
+
+    async def refresh_leases(self):
+        """Renew the leases and take over the subscriptions of dead replicas.
+
+        The state of a newly acquired subscription is read from the store,
+        where the previous owner has left it, and the subscription joins
+        the queue; the ones whose lease is lost leave it.
+        """
+        try:
+            acquired = await self.call(
+                self.leases.refresh,
+                [subscription.key for subscription in self.subscriptions],
+            )
+        except Exception as error:
+            logger.error('Failed to renew the leases: %s', error)
+            return
+        for subscription in self.subscriptions:
+            if subscription.key in acquired:
+                subscription.fingerprint = ResponseFingerprint()
+                if self.store is not None:
+                    self.store.load(subscription)
+                self.reschedule(
+                    subscription, self.schedule.first_delay(subscription)
+                )
+            elif not self.holds(subscription):
+                self.queue.remove(subscription)
+
+    async def keep_roster(self):
+        """Apply the changes of the roster while polling.
+
+        The roster is checked every ROSTER_CHECK_INTERVAL seconds, and at
+        once when the process gets SIGHUP.
+        """
+        loop = asyncio.get_running_loop()
+        self.reload_requested = asyncio.Event()
+        hangup = getattr(signal, 'SIGHUP', None)
+        try:
+            loop.add_signal_handler(hangup, self.request_reload)
+        except (TypeError, ValueError, RuntimeError, NotImplementedError):
+            hangup = None
+        try:
+            while True:
+                await wait_event(self.reload_requested, ROSTER_CHECK_INTERVAL)
+                self.reload_requested.clear()
+                force, self.reload_forced = self.reload_forced, False
+                subscriptions = await self.call(self.roster.reload, force)
+                if subscriptions is not None:
+                    await self.apply_roster(subscriptions)
+        finally:
+            if hangup is not None:
+                loop.remove_signal_handler(hangup)
+
+    def request_reload(self):
+        logger.info('Reloading the roster')
+        self.reload_forced = True
+        self.reload_requested.set()
+
+    async def apply_roster(self, subscriptions):
+        """Start polling the added subscriptions and stop the removed ones.
+
+        Subscriptions found in both rosters keep their state and schedule.
+        Returns the numbers of added and removed subscriptions.
+        """
+        roster = {
+            subscription.key: subscription for subscription in subscriptions
+        }
+        removed = [
+            subscription for key, subscription in self.by_key.items()
+            if key not in roster
+        ]
+        added = [
+            subscription for key, subscription in roster.items()
+            if key not in self.by_key
+        ]
+        for subscription in removed:
+            del self.by_key[subscription.key]
+            self.queue.remove(subscription)
+        if removed and self.leases is not None:
+            await self.call(
+                self.leases.release,
+                [subscription.key for subscription in removed],
+            )
+        for subscription in added:
+            if self.store is not None:
+                self.store.load(subscription)
+            self.by_key[subscription.key] = subscription
+            if self.holds(subscription):
+                self.reschedule(
+                    subscription, self.schedule.first_delay(subscription)
+                )
+        self.subscriptions = list(self.by_key.values())
+        SUBSCRIPTIONS.set(len(self.subscriptions))
+        if self.on_roster is not None:
+            self.on_roster(self.subscriptions)
+        logger.info(
+            'Roster applied: %s subscriptions added, %s removed, %s polled',
+            len(added), len(removed), len(self.subscriptions),
+        )
+        return len(added), len(removed)
+
+    async def keep_history(self):
+        while True:
+            await asyncio.sleep(HISTORY_MAINTAIN_INTERVAL)
+            try:
+                await self.call(self.history.maintain)
+            except Exception as error:
+                logger.error('Failed to compact the history: %s', error)
+
+    async def record(self, subscription, transitions):
+        """Pass the transitions to the analytics and the history log.
+
+        Before the first answer the cursor is zero and the statuses found
+        are a snapshot of the history rather than changes.
+        """
+        if self.analytics is not None:
+            self.analytics.observe(
+                subscription.key, transitions,
+                snapshot=not subscription.current_timestamp,
+            )
+        if self.history is None:
+            return
+        try:
+            await self.call(
+                self.history.extend, subscription.key, transitions
+            )
+        except Exception as error:
+            logger.error('Failed to record the transitions: %s', error)
+
+    async def keep_leases(self):
+        while True:
+            await asyncio.sleep(self.leases.renew_interval)
+            await self.refresh_leases()
+
+    async def call(self, func, *args):
+        """Run a blocking function in the engine's thread pool.
+
+        The function runs in a copy of the current context, so it sees the
+        deadline of the poll.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(context.run, func, *args)
+        )
+
+    async def send(self, subscription, message):
+        """Send a message to the chat of the subscription."""
+        if self.dispatcher is not None:
+            if not self.dispatcher.offer(subscription.chat_id, message):
+                await self.call(
+                    self.dispatcher.submit, subscription.chat_id, message
+                )
+            return
+        await self.call(
+            send_chat_message, self.bot, subscription.chat_id, message
+        )
+
+    async def poll(self, subscription):
+        """Make a single polling iteration for the subscription."""
+        try:
+            response = await self.fetch(subscription)
+            try:
+                await self.handle(subscription, response)
+            finally:
+                if self.streaming:
+                    # returns the connection to the pool if the body is unread
+                    response.close()
+        except CircuitOpen as error:
+            POLLS.inc(outcome='circuit_open')
+            logger.debug('Skipped the poll: %s', error)
+        except NotForSending as error:
+            subscription.error_count += 1
+            POLLS.inc(outcome=(
+                'deadline' if isinstance(error, DeadlineExceeded) else 'error'
+            ))
+            logger.error('Failure. Error: %s', error)
+        except Exception as error:
+            subscription.error_count += 1
+            POLLS.inc(outcome='error')
+            await self.report_failure(subscription, error)
+
+    async def handle(self, subscription, response):
+        """Notify about the changes found in the answer of the API."""
+        fingerprint = subscription.fingerprint
+        digest = None
+        if not self.streaming and response.status_code == HTTPStatus.OK:
+            digest = response_digest(response.content)
+        if fingerprint.unchanged(response, digest):
+            subscription.error_count = 0
+            self.cache_statuses(subscription)
+            POLLS.inc(outcome='unchanged')
+            logger.info('The API response has not changed')
+            return
+        snapshot = not subscription.current_timestamp
+        changes, records, latest, current_date = await self.read_changes(
+            subscription, response
+        )
+        if latest is not None:
+            subscription.last_status = intern_name(latest['status'])
+        subscription.error_count = 0
+        if await self.notify(subscription, changes):
+            self.advance(subscription, changes, current_date)
+            POLLS.inc(outcome='changed')
+        else:
+            POLLS.inc(outcome='no_changes')
+            logger.info('There are no new homework statuses')
+        self.cache_statuses(subscription, records, snapshot)
+        fingerprint.remember(response, digest)
+
+    def cache_statuses(self, subscription, records=None, snapshot=False):
+        """Keep the /status answer of the subscription's token current."""
+        if self.status_cache is None:
+            return
+        if records is None:
+            self.status_cache.touch(subscription.practicum_token)
+        else:
+            self.status_cache.update(
+                subscription.practicum_token, records, snapshot=snapshot
+            )
+
+    def advance(self, subscription, changes, current_date):
+        """Move the cursor and persist the state after sending changes."""
+        subscription.last_change = time.monotonic()
+        if current_date is not None:
+            subscription.current_timestamp = current_date
+        self.save(subscription, changes)
+
+    async def fetch(self, subscription):
+        """Request the API through the circuit breaker."""
+        if not self.breaker.allow():
+            raise CircuitOpen(f'Circuit {self.breaker.name} is open')
+        args = (
+            fetch_api_response,
+            subscription.practicum_token,
+            subscription.current_timestamp,
+            subscription.fingerprint.validators(),
+            self.streaming,
+        )
+        try:
+            if self.hedger is None:
+                response = await self.call(*args)
+            else:
+                response = await self.hedger.call(
+                    lambda: asyncio.ensure_future(self.call(*args)),
+                    discard=lambda response: response.close(),
+                )
+        except Exception as error:
+            if isinstance(error, DeadlineExceeded) and not error.__cause__:
+                # the time ran out before the request was sent
+                self.breaker.release()
+            elif is_outage(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def set_rates(self, global_rate, hedge_rate):
+        """Apply new shares of the Telegram and hedging rate limits."""
+        if self.dispatcher is not None:
+            self.dispatcher.global_bucket.set_rate(global_rate)
+        if self.hedger is not None:
+            self.hedger.bucket.set_rate(hedge_rate)
+
+    def circuit_changed(self, breaker, state):
+        """Send one message about the whole outage instead of one per user.
+
+        A failed probe opens the circuit again; only the first opening and
+        the final closing are announced.
+        """
+        CIRCUIT_OPEN.set(int(state != CLOSED), endpoint=breaker.name)
+        if state not in OUTAGE_MESSAGES:
+            return
+        if self.outage_announced == (state == OPEN):
+            return
+        self.outage_announced = state == OPEN
+        message = OUTAGE_MESSAGES[state]
+        chat_id = OUTAGE_CHAT_ID or homework.TELEGRAM_CHAT_ID
+        if not chat_id:
+            return
+        if self.dispatcher is not None:
+            self.dispatcher.offer(chat_id, message)
+        else:
+            logger.warning(message)
+
+    async def read_changes(self, subscription, response):
+        """Diff the homeworks of the response against the status index.
+
+        Returns the changes, the homeworks as records (None without a
+        status cache), the latest homework and the `current_date`.
+        """
+        records = None if self.status_cache is None else []
+        if self.streaming:
+            stream = HomeworkStream(
+                response.iter_content(CHUNK_SIZE), close=response.close
+            )
+            homeworks = stream
+            if records is not None:
+                homeworks = record_homeworks(stream, records)
+            changes = await self.call(
+                diff_statuses, subscription.statuses, homeworks
+            )
+            return changes, records, stream.first, stream.current_date
+        answer = response.json()
+        homeworks = check_response(answer)
+        changes = diff_statuses(subscription.statuses, homeworks)
+        if records is not None:
+            records = compact_homeworks(homeworks)
+        latest = homeworks[0] if homeworks else None
+        return changes, records, latest, answer.get('current_date')
+
+    async def report_failure(self, subscription, error):
+        """Tell the user about a failure unless it has just been reported.
+
+        Outages are reported once for everybody by `circuit_changed()`.
+        A failure of the same kind as the last one is not sent again,
+        whatever the details of its message.
+        """
+        if is_outage(error):
+            logger.error('Failure. Error: %s', error)
+            return
+        logger.exception('Failure. Error: %s', error)
+        current_report = f'Failure: {type(error).__name__}'
+        if current_report != subscription.previous_report:
+            message = f'Failure. Error: {error}'.replace(
+                subscription.practicum_token, '***'
+            )
+            await self.send(subscription, message)
+            subscription.previous_report = current_report
+            self.save(subscription)
+
+    async def notify(self, subscription, changes):
+        """Send a message for every transition; return whether any was sent.
+
+        The first answer of a subscription is its whole history, so only
+        the latest homework is reported and the rest just fill the index.
+        """
+        if not self.holds(subscription):
+            raise LeaseLost(f'Lease of {subscription.key} has expired')
+        check_deadline('notify')
+        if changes:
+            transitions = [
+                (key, subscription.statuses.get(key), status)
+                for key, status, _ in changes
+            ]
+            reported = changes
+            if not subscription.current_timestamp or not subscription.statuses:
+                reported = changes[:1]
+            for _, _, message in reported:
+                await self.send(subscription, message)
+            subscription.statuses.update(
+                (key, status) for key, status, _ in changes
+            )
+            subscription.previous_report = message
+            await self.record(subscription, transitions)
+            return True
+        if subscription.statuses:
+            return False
+        current_report = 'There is no homework'
+        if current_report == subscription.previous_report:
+            return False
+        await self.send(subscription, current_report)
+        subscription.previous_report = current_report
+        return True
+
+    def save(self, subscription, changes=()):
+        """Persist the state of the subscription if there is a store."""
+        if self.store is not None:
+            self.store.save(subscription, changes)
+
+
+def make_bot(token=None, base_url=None):
+    """The function creates a bot with a connection per sender thread."""
+    request = Request(con_pool_size=TELEGRAM_SENDERS + 1)
+    return telegram.Bot(
+        token=token or homework.TELEGRAM_TOKEN,
+        base_url=base_url,
+        request=request,
+    )
+
+
+def serve(subscriptions, commands=COMMANDS_ENABLED,
+          global_rate=TELEGRAM_GLOBAL_RATE, metrics_port=METRICS_PORT,
+          history_path=HISTORY_FILE, hedge_rate=HEDGE_RATE, roster=None,
+          status_cache=None, analytics=None):
+    """The function polls the subscriptions in this process until stopped.
+
+    With a lease store the replica keeps its own
+    `history_path.<REPLICA_ID>`: the transition log has a single writer.
+    """
+    bot = make_bot()
+    store = StateStore(STATE_FILE)
+    lease_store = create_lease_store()
+    leases = None
+    if lease_store is not None:
+        leases = LeaseKeeper(lease_store)
+        history_path = history_path and replica_path(history_path)
+    history = TransitionLog(history_path) if history_path else None
+    dispatcher = TelegramDispatcher(bot, global_rate=global_rate)
+    dispatcher.start()
+    if metrics_port:
+        REGISTRY.add_collector(
+            lambda: SEND_BACKLOG.set(dispatcher.backlog)
+        )
+        start_metrics_server(metrics_port)
+    if status_cache is None:
+        status_cache = StatusCache()
+    if analytics is None:
+        analytics = ReviewAnalytics()
+    listener = None
+    if commands:
+        listener = CommandListener(
+            bot, subscriptions, dispatcher, StatusService(status_cache),
+            analytics,
+            lease=leases and LeaseKeeper(
+                lease_store, owner=leases.owner, fair_share=False
+            ),
+        )
+        listener.start()
+    engine = PollingEngine(
+        bot, subscriptions, store=store, dispatcher=dispatcher,
+        status_cache=status_cache, leases=leases, history=history,
+        analytics=analytics,
+        hedger=Hedger(rate=hedge_rate) if HEDGE_REQUESTS else None,
+        roster=roster,
+        on_roster=listener and listener.set_roster,
+    )
+    if hasattr(roster, 'on_rates'):
+        # the shard receiver of a worker also brings new rate shares
+        roster.on_rates = engine.set_rates
+    try:
+        asyncio.run(engine.run())
+    finally:
+        if listener is not None:
+            listener.stop()
+        dispatcher.stop()
+        if lease_store is not None:
+            lease_store.close()
+        if history is not None:
+            history.close()
+        store.close()
+
+
+def main():
+    """The main logic of the bot.
+
+    Replicas sharing a lease store are told apart by REPLICA_ID and log to
+    their own `LOG_FILE.<REPLICA_ID>`.
+    """
+    setup_logging(path=replica_path(LOG_FILE))
+    if LEASE_STORE and not REPLICA_ID:
+        logger.critical('Environment variable is missing : REPLICA_ID')
+        raise InvalidTokens('An error has occured in environment variable(s)')
+    subscriptions = load_roster()
+    if not check_roster(subscriptions):
+        raise InvalidTokens('An error has occured in environment variable(s)')
+    logger.info('Token verification has completed successfully.')
+    if WORKERS > 1:
+        from supervisor import Supervisor
+        Supervisor(subscriptions, WORKERS).run()
+        return
+    serve(subscriptions, roster=RosterFile() if ROSTER_FILE else None)
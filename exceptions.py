@@ -16,3 +16,23 @@ class InvalidTokens(NotForSending):
 class InvalidResponseCode(Exception):
     """Invalid server response code."""
     pass
+
+
+class ServerError(InvalidResponseCode):
+    """The API server has failed to answer."""
+    pass
+
+
+class CircuitOpen(NotForSending):
+    """Requests to the API are suspended during an outage."""
+    pass
+
+
+class LeaseLost(NotForSending):
+    """Another replica may be polling the subscription now."""
+    pass
+
+
+class DeadlineExceeded(NotForSending):
+    """The polling iteration has run out of time."""
+    pass
@@ -0,0 +1,49 @@
+from hashlib import blake2b
+from http import HTTPStatus
+import re
+
+
+CURRENT_DATE = re.compile(rb'"current_date"\s*:\s*-?[\d.eE+-]+')
+
+
+def response_digest(body):
+    """The function returns a digest of the response body.
+
+    `current_date` changes with every request even if nothing else does,
+    so it is left out of the digest.
+    """
+    return blake2b(CURRENT_DATE.sub(b'', body), digest_size=16).digest()
+
+
+class ResponseFingerprint:
+    """What is known about the last processed response of a subscription."""
+
+    __slots__ = ('digest', 'etag', 'last_modified')
+
+    def __init__(self):
+        self.digest = None
+        self.etag = None
+        self.last_modified = None
+
+    def validators(self):
+        """Return the headers of a conditional request."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def unchanged(self, response, digest=None):
+        """Check whether the response repeats the last processed one."""
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return True
+        return digest is not None and digest == self.digest
+
+    def remember(self, response, digest=None):
+        """Remember a response that has been processed successfully."""
+        if response.status_code == HTTPStatus.NOT_MODIFIED:
+            return
+        self.digest = digest
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
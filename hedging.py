@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+
+from analytics import P2Quantile
+from dispatcher import TokenBucket
+from metrics import HEDGES
+
+
+logger = logging.getLogger(__name__)
+
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', '') == '1'
+HEDGE_RATE = float(os.getenv('HEDGE_RATE', 1))
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+
+class Hedger:
+    """Sends a second copy of a request that is slower than usual.
+
+    When a request has not answered within the `quantile` of the latencies
+    seen so far, an identical one is started and the first to succeed wins.
+    No more than `rate` copies per second are sent, so an API that is slow
+    for everybody does not get twice the load.
+    """
+
+    def __init__(self, quantile=HEDGE_QUANTILE, rate=HEDGE_RATE,
+                 min_samples=HEDGE_MIN_SAMPLES):
+        self.latency = P2Quantile(quantile)
+        self.bucket = TokenBucket(rate)
+        self.min_samples = min_samples
+
+    def delay(self):
+        """Return how long to wait before the copy, None while learning."""
+        if self.latency.count < self.min_samples:
+            return None
+        return self.latency.value()
+
+    def observe(self, attempt, started):
+        if not attempt.cancelled() and attempt.exception() is None:
+            self.latency.add(asyncio.get_running_loop().time() - started)
+
+    async def call(self, start, discard=None):
+        """Await the request made by `start()`, hedging it if it is slow.
+
+        `start` returns a future of a new attempt; the result of an attempt
+        that has lost the race is passed to `discard`.
+        """
+        started = asyncio.get_running_loop().time()
+        attempts = [start()]
+        attempts[0].add_done_callback(
+            lambda attempt: self.observe(attempt, started)
+        )
+        winner = None
+        try:
+            winner = await self.race(attempts, start)
+        finally:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.add_done_callback(
+                        lambda attempt: discard_result(attempt, discard)
+                    )
+        return winner.result()
+
+    async def race(self, attempts, start):
+        """Wait for the first attempt, starting a copy once it is late."""
+        delay = self.delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done and not self.bucket.consume():
+                HEDGES.inc(outcome='sent')
+                attempts.append(start())
+                winner = await first_success(attempts)
+                if winner is attempts[1]:
+                    HEDGES.inc(outcome='won')
+                return winner
+            if not done:
+                HEDGES.inc(outcome='limited')
+        await asyncio.wait(attempts)
+        return attempts[0]
+
+
+async def first_success(attempts):
+    """The function waits for the first attempt that has not failed.
+
+    When every attempt fails, the last one to finish is returned.
+    """
+    pending = set(attempts)
+    while True:
+        done, pending = await asyncio.wait(
+            pending, return_when=asyncio.FIRST_COMPLETED
+        )
+        for attempt in done:
+            if attempt.exception() is None:
+                return attempt
+        if not pending:
+            return attempt
+
+
+def discard_result(attempt, discard):
+    """The function disposes of the result of an attempt that has lost."""
+    if attempt.cancelled() or attempt.exception() is not None:
+        return
+    if discard is None:
+        return
+    try:
+        discard(attempt.result())
+    except Exception as error:
+        logger.debug('Failed to discard a hedged request: %s', error)
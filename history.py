@@ -0,0 +1,280 @@
+from bisect import bisect_left
+from collections import namedtuple
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from records import STATUS_CODES, STATUSES
+
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILE = os.getenv('HISTORY_FILE', 'history.bin')
+HISTORY_RETENTION = float(os.getenv('HISTORY_RETENTION', 365 * 24 * 60 * 60))
+HISTORY_MAX_RECORDS = int(os.getenv('HISTORY_MAX_RECORDS', 10_000_000))
+INDEX_TAIL = 10_000
+
+MAGIC = b'HWHIST01'
+INDEX_MAGIC = b'HWINDX01'
+NO_STATUS = -1
+# timestamp, subscription key, homework digest, old and new status codes
+RECORD = struct.Struct('<d16s8sbb6x')
+# homework digest, timestamp, offset of the record in the log
+INDEX_ENTRY = struct.Struct('<8sdQ')
+INDEX_HEADER = struct.Struct('<8sQ')
+
+Transition = namedtuple(
+    'Transition', 'subscription homework old_status new_status timestamp'
+)
+
+
+def homework_digest(homework):
+    """The function returns the 8-byte digest stored for a homework key."""
+    return hashlib.blake2b(homework.encode(), digest_size=8).digest()
+
+
+def status_code(status):
+    if status is None:
+        return NO_STATUS
+    return status if isinstance(status, int) else STATUS_CODES[status]
+
+
+def decode(buffer, offset):
+    timestamp, subscription, homework, old, new = RECORD.unpack_from(
+        buffer, offset
+    )
+    return Transition(
+        subscription.hex(),
+        homework.hex(),
+        STATUSES[old] if old != NO_STATUS else None,
+        STATUSES[new] if new != NO_STATUS else None,
+        timestamp,
+    )
+
+
+class Records:
+    """Sequence view of fixed-size structs in a buffer, for bisect."""
+
+    def __init__(self, buffer, start, size, key):
+        self.buffer = buffer
+        self.start = start
+        self.size = size
+        self.key = key
+        self.count = (len(buffer) - start) // size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.key(self.buffer, self.start + index * self.size)
+
+
+def record_time(buffer, offset):
+    return struct.unpack_from('<d', buffer, offset)[0]
+
+
+def index_key(buffer, offset):
+    return INDEX_ENTRY.unpack_from(buffer, offset)[:2]
+
+
+class TransitionLog:
+    """Append-only binary log of homework status transitions.
+
+    Records have a fixed size and are appended in time order, so a time
+    range is found by binary search in the memory-mapped log. Queries by
+    homework use a sorted index file of (homework, time, offset) entries,
+    also memory-mapped, plus a scan of the records appended after the
+    index was built. `compact()` drops the records older than the retention
+    period or beyond the maximum count and rebuilds the index.
+    """
+
+    def __init__(self, path=HISTORY_FILE, retention=HISTORY_RETENTION,
+                 max_records=HISTORY_MAX_RECORDS):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.retention = retention
+        self.max_records = max_records
+        self.lock = threading.Lock()
+        self.last_time = 0.0
+        self.file = self.open_log()
+
+    def open_log(self):
+        log = open(self.path, 'a+b')
+        size = log.seek(0, os.SEEK_END)
+        if size == 0:
+            log.write(MAGIC)
+            log.flush()
+            return log
+        log.seek(0)
+        if log.read(len(MAGIC)) != MAGIC:
+            log.close()
+            raise ValueError(f'{self.path} is not a transition log')
+        torn = (size - len(MAGIC)) % RECORD.size
+        if torn:
+            logger.warning('Dropping a torn record of %s', self.path)
+            size = log.truncate(size - torn)
+        if size > len(MAGIC):
+            log.seek(size - RECORD.size)
+            self.last_time = record_time(log.read(RECORD.size), 0)
+        return log
+
+    def append(self, subscription, homework, old_status, new_status,
+               timestamp=None):
+        """Write a transition; `subscription` is the hex key."""
+        self.extend(
+            subscription, [(homework, old_status, new_status)], timestamp
+        )
+
+    def extend(self, subscription, transitions, timestamp=None):
+        """Write (homework, old status, new status) transitions at once."""
+        timestamp = time.time() if timestamp is None else timestamp
+        key = bytes.fromhex(subscription)
+        with self.lock:
+            timestamp = max(timestamp, self.last_time)
+            self.last_time = timestamp
+            self.file.write(b''.join(
+                RECORD.pack(
+                    timestamp,
+                    key,
+                    homework_digest(homework),
+                    status_code(old_status),
+                    status_code(new_status),
+                )
+                for homework, old_status, new_status in transitions
+            ))
+            self.file.flush()
+
+    def __len__(self):
+        with self.lock:
+            size = self.file.seek(0, os.SEEK_END)
+        return (size - len(MAGIC)) // RECORD.size
+
+    def mapped(self, path):
+        """Map the file read-only; return None if it has no records."""
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size <= len(MAGIC):
+                return None
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def between(self, start=None, end=None):
+        """Yield the transitions with `start <= timestamp < end`."""
+        buffer = self.mapped(self.path)
+        if buffer is None:
+            return
+        with buffer:
+            records = Records(buffer, len(MAGIC), RECORD.size, record_time)
+            first = 0 if start is None else bisect_left(records, start)
+            last = len(records) if end is None else bisect_left(records, end)
+            for position in range(first, last):
+                yield decode(buffer, len(MAGIC) + position * RECORD.size)
+
+    def indexed(self, digest=b''):
+        """Return the log size covered by the index and the offsets in it."""
+        if not os.path.exists(self.index_path):
+            return len(MAGIC), []
+        index = self.mapped(self.index_path)
+        with index:
+            indexed_until = INDEX_HEADER.unpack_from(index)[1]
+            entries = Records(
+                index, INDEX_HEADER.size, INDEX_ENTRY.size, index_key
+            )
+            position = bisect_left(entries, (digest, float('-inf')))
+            offsets = []
+            while position < len(entries):
+                homework, _, offset = INDEX_ENTRY.unpack_from(
+                    index, INDEX_HEADER.size + position * INDEX_ENTRY.size
+                )
+                if homework != digest:
+                    break
+                offsets.append(offset)
+                position += 1
+        return indexed_until, offsets
+
+    def for_homework(self, homework):
+        """Yield the transitions of the homework in time order."""
+        digest = homework_digest(homework)
+        with self.lock:
+            indexed_until, offsets = self.indexed(digest)
+            buffer = self.mapped(self.path)
+        if buffer is None:
+            return
+        with buffer:
+            for offset in offsets:
+                yield decode(buffer, offset)
+            for offset in range(indexed_until, len(buffer), RECORD.size):
+                if buffer[offset + 24:offset + 32] == digest:
+                    yield decode(buffer, offset)
+
+    def build_index(self):
+        """Write the sorted index of every record in the log."""
+        with self.lock:
+            buffer = self.mapped(self.path)
+            if buffer is None:
+                entries, size = [], len(MAGIC)
+            else:
+                with buffer:
+                    size = len(buffer)
+                    entries = sorted(
+                        (buffer[offset + 24:offset + 32],
+                         record_time(buffer, offset), offset)
+                        for offset in range(len(MAGIC), size, RECORD.size)
+                    )
+            temporary = self.index_path + '.tmp'
+            with open(temporary, 'wb') as index:
+                index.write(INDEX_HEADER.pack(INDEX_MAGIC, size))
+                for entry in entries:
+                    index.write(INDEX_ENTRY.pack(*entry))
+            os.replace(temporary, self.index_path)
+        logger.info('Indexed %s transitions', len(entries))
+
+    def compact(self, now=None):
+        """Drop the records that are too old or too many; return how many.
+
+        The records to keep are a suffix of the log, so they are copied to
+        a new file that replaces the log, and the index is rebuilt.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            buffer = self.mapped(self.path)
+            if buffer is None:
+                return 0
+            with buffer:
+                records = Records(buffer, len(MAGIC), RECORD.size, record_time)
+                first = max(
+                    bisect_left(records, now - self.retention),
+                    len(records) - self.max_records,
+                )
+                if first <= 0:
+                    return 0
+                temporary = self.path + '.tmp'
+                with open(temporary, 'wb') as compacted:
+                    compacted.write(MAGIC)
+                    compacted.write(
+                        buffer[len(MAGIC) + first * RECORD.size:]
+                    )
+            self.file.close()
+            os.replace(temporary, self.path)
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            self.file = self.open_log()
+        logger.info('Compacted the transition log: %s records dropped', first)
+        self.build_index()
+        return first
+
+    def maintain(self):
+        """Compact the log and reindex it when enough records are new."""
+        if self.compact():
+            return
+        indexed_until = self.indexed()[0]
+        with self.lock:
+            size = self.file.seek(0, os.SEEK_END)
+        if (size - indexed_until) // RECORD.size >= INDEX_TAIL:
+            self.build_index()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -1,36 +1,19 @@
 from http import HTTPStatus
 import logging
 import os
-import sys
-import time
-
-import requests
-import telegram
-
-from dotenv import load_dotenv
+import threading
 
+from deadline import cap_timeout, expired
 from exceptions import (
+    DeadlineExceeded,
     EmptyAPIReply,
     InvalidResponseCode,
-    InvalidTokens,
-    NotForSending,
+    ServerError,
 )
+from metrics import MESSAGES, stage
 
 
 logger = logging.getLogger(__name__)
-logger.addHandler(
-    logging.StreamHandler(sys.stdout),
-
-)
-logger.addHandler(
-    logging.FileHandler(
-        os.path.join('main.log'),
-        mode='a',
-        encoding='utf-8',
-        delay=False
-    )
-)
-load_dotenv()
 
 
 PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
@@ -53,46 +36,178 @@ TOKENS = (
     ('TELEGRAM_CHAT_ID', TELEGRAM_CHAT_ID),
 )
 
+api_client = None
+API_CLIENT_LOCK = threading.Lock()
+
+
+def init():
+    """The function loads the .env file and reads the tokens from it.
+
+    Importing the module has no side effects; the entry points call this
+    once before anything else is imported.
+    """
+    from dotenv import load_dotenv
+
+    global PRACTICUM_TOKEN, TELEGRAM_TOKEN, TELEGRAM_CHAT_ID, HEADERS, TOKENS
+    load_dotenv()
+    PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
+    TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    HEADERS = make_headers(PRACTICUM_TOKEN)
+    TOKENS = (
+        ('PRACTICUM_TOKEN', PRACTICUM_TOKEN),
+        ('TELEGRAM_TOKEN', TELEGRAM_TOKEN),
+        ('TELEGRAM_CHAT_ID', TELEGRAM_CHAT_ID),
+    )
+
+
+def get_client():
+    """The function creates the API client on first use."""
+    global api_client
+    if api_client is None:
+        with API_CLIENT_LOCK:
+            if api_client is None:
+                from api_client import create_client
+                api_client = create_client()
+    return api_client
+
+
+def make_headers(practicum_token):
+    """The function builds authorization headers for a Practicum token."""
+    return {'Authorization': f'OAuth {practicum_token}'}
+
+
+def redact_headers(headers):
+    """The function hides the token so that headers can be logged."""
+    if 'Authorization' not in headers:
+        return headers
+    return {**headers, 'Authorization': 'OAuth ***'}
+
 
 def send_message(bot, message):
     """The function sends messages to the user."""
+    import telegram
+
+    try:
+        send_chat_message(bot, TELEGRAM_CHAT_ID, message)
+    except telegram.error.RetryAfter as error:
+        logger.error('Error: %s', error)
+
+
+@stage('send_message')
+def send_chat_message(bot, chat_id, message):
+    """The function sends messages to the given chat.
+
+    Returns whether the message has been sent. Flood control errors are
+    raised so that the caller can retry later. Within a deadline the
+    request may take only the time left, and a timeout after it has
+    expired raises DeadlineExceeded.
+    """
+    import telegram
+
+    options = {}
+    timeout = cap_timeout(None, 'send_message')
+    if timeout is not None:
+        options['timeout'] = timeout
     try:
-        logger.info(f'The message was sent: {message}')
-        bot.send_message(chat_id=TELEGRAM_CHAT_ID, text=message)
+        logger.info('The message was sent: %s', message)
+        bot.send_message(chat_id=chat_id, text=message, **options)
+    except telegram.error.RetryAfter:
+        MESSAGES.inc(outcome='retry_after')
+        raise
     except telegram.error.TelegramError as error:
-        logger.error(f'Error: {error}')
-    else:
-        logger.info('The message has been successfuly sent')
+        MESSAGES.inc(outcome='failed')
+        if expired('send_message'):
+            raise DeadlineExceeded(
+                f'The message was not sent in time: {error}'
+            ) from error
+        logger.error('Error: %s', error)
+        return False
+    MESSAGES.inc(outcome='sent')
+    logger.info('The message has been successfuly sent')
+    return True
 
 
 def get_api_answer(current_timestamp):
     """The function sends a request to a single endpoint of API service."""
+    return request_api_answer(HEADERS, current_timestamp)
+
+
+def fetch_api_answer(practicum_token, current_timestamp):
+    """The function requests homework statuses for the given token."""
+    return request_api_answer(make_headers(practicum_token), current_timestamp)
+
+
+def fetch_api_response(practicum_token, current_timestamp, validators=None,
+                       stream=False):
+    """The function requests homework statuses and returns the response.
+
+    `validators` are conditional request headers (If-None-Match,
+    If-Modified-Since); a `304 Not Modified` answer to them is returned too.
+    """
+    headers = make_headers(practicum_token)
+    if validators:
+        headers.update(validators)
+    return request_api_answer(
+        headers, current_timestamp, stream=stream, raw=True
+    )
+
+
+def request_api_answer(headers, current_timestamp, stream=False, raw=False):
+    """The function sends a request with the given headers to the API.
+
+    With `raw` the checked response itself is returned; with `stream` as
+    well, its body is not downloaded before the caller reads it.
+    """
+    expected_codes = (HTTPStatus.OK,)
+    if raw:
+        expected_codes = (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED)
     params_for_response = {
         'url': ENDPOINT,
-        'headers': HEADERS,
+        'headers': headers,
         'params': {'from_date': current_timestamp},
     }
+    params_for_log = {
+        **params_for_response, 'headers': redact_headers(headers)
+    }
     try:
         logger.info(
             'API request with the following parameters:'
-            '{url}, {headers}, {params}.'.format(**params_for_response)
+            '%(url)s, %(headers)s, %(params)s.', params_for_log
         )
-        response = requests.get(**params_for_response)
-        if response.status_code != HTTPStatus.OK:
-            raise InvalidResponseCode(
-                f'Server response code: {response.status_code},'
-                f'reason: {response.reason},'
-                f'text: {response.json}'
+        with stage('get_api_answer'):
+            response = get_client().get(
+                **params_for_response, stream=stream
             )
+            if response.status_code not in expected_codes:
+                if stream:
+                    response.close()
+                error_class = InvalidResponseCode
+                if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                    error_class = ServerError
+                raise error_class(
+                    f'Server response code: {response.status_code},'
+                    f'reason: {response.reason},'
+                    f'text: {response.json}'
+                )
+        if raw:
+            return response
         return response.json()
+    except DeadlineExceeded:
+        raise
     except Exception as error:
+        if expired('get_api_answer'):
+            raise DeadlineExceeded(
+                f'The API has not answered in time: {error}'
+            ) from error
         raise ConnectionError(
             f'Error: {error}.'
             'API request has failed with the following parameters:'
-            '{url}, {headers}, {params}.'.format(**params_for_response)
-        )
+            '{url}, {headers}, {params}.'.format(**params_for_log)
+        ) from error
 
 
+@stage('check_response')
 def check_response(response):
     """The function checks API response for correctness."""
     logger.info('Start checking the API response for correctness')
@@ -107,6 +222,7 @@ def check_response(response):
     return homeworks
 
 
+@stage('parse_status')
 def parse_status(homework):
     """The function extracts the status of the homework."""
     keys = (
@@ -124,7 +240,7 @@ def parse_status(homework):
         raise ValueError(
             f'Unexpected work status has been received: "{homework_status}".'
         )
-    logger.info(f'Work status has been received {homework_name}')
+    logger.info('Work status has been received %s', homework_name)
     return (
         'The status of the work has changed "{homework_name}".'
         '{verdict}'.format(
@@ -144,61 +260,17 @@ def check_tokens():
     token_checked = True
     for token, value in TOKENS:
         if not value:
-            logger.critical(
-                'Environment variable is missing : {}'.format(token)
-            )
+            logger.critical('Environment variable is missing : %s', token)
             token_checked = False
     return token_checked
 
 
 def main():
     """The main logic of the bot."""
-    if not check_tokens():
-        raise InvalidTokens('An error has occured in environment variable(s)')
-    logger.info('Token verification has completed successfully.')
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
-    current_timestamp = 0
-    current_report = {}
-    previous_report = {}
-    while True:
-        try:
-            response = get_api_answer(current_timestamp)
-            homeworks = check_response(response)
-            if homeworks:
-                homework = homeworks[0]
-                message = parse_status(homework)
-                current_report['message'] = message
-            else:
-                message = 'There is no homework'
-                current_report['message'] = message
-            if current_report != previous_report:
-                send_message(bot, message)
-                previous_report = current_report.copy()
-                current_timestamp = response.get(
-                    'current_date',
-                    current_timestamp
-                )
-            else:
-                logger.info('There are no new homework statuses')
-        except NotForSending as error:
-            message = 'Failure. Error: {}'
-            logger.error(message.format(error))
-        except Exception as error:
-            message = 'Failure. Error: {}'
-            logger.exception(message.format(error))
-            current_report['message'] = message
-            if current_report != previous_report:
-                send_message(bot, message)
-                previous_report = current_report.copy()
-        finally:
-            time.sleep(RETRY_TIME)
+    from engine import main as run_engine
+    run_engine()
 
 
 if __name__ == '__main__':
-    logging.basicConfig(
-        level=logging.INFO,
-        filename='main.log',
-        format='%(asctime)s, %(levelname)s, %(message)s, %(name)s,',
-        filemode='a',
-    )
+    init()
     main()
@@ -0,0 +1,290 @@
+from abc import ABC, abstractmethod
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from state import STATE_FILE
+
+
+logger = logging.getLogger(__name__)
+
+LEASE_STORE = os.getenv('LEASE_STORE', '')
+LEASE_FILE = os.getenv('LEASE_FILE', STATE_FILE)
+LEASE_TTL = float(os.getenv('LEASE_TTL', 15))
+REPLICA_ID = os.getenv('REPLICA_ID', '')
+
+
+def make_owner():
+    """The function returns a unique name of this replica in the leases."""
+    name = REPLICA_ID or f'{socket.gethostname()}:{os.getpid()}'
+    return f'{name}:{uuid.uuid4().hex[:8]}'
+
+
+def replica_path(path):
+    """The function names a file of this replica after REPLICA_ID.
+
+    Unlike the lease owner the name survives a restart, so the replica
+    goes on with its own log and history files.
+    """
+    return f'{path}.{REPLICA_ID}' if REPLICA_ID else path
+
+
+class LeaseStore(ABC):
+    """Storage of leases shared by the replicas.
+
+    `acquire()` takes every free or expired lease of `keys` for `owner` and
+    extends the leases the owner already holds; it returns the keys held by
+    the owner afterwards. Calling it again before the TTL runs out renews
+    the leases. With a `limit` the owner keeps no more than `limit` keys
+    and gives up the rest.
+
+    `join()` tells the store that the owner is alive for `ttl` seconds and
+    returns how many owners are, so that each can take its fair share.
+    """
+
+    @abstractmethod
+    def acquire(self, keys, owner, ttl, now=None, limit=None):
+        pass
+
+    @abstractmethod
+    def release(self, keys, owner):
+        """Give up the leases of the owner so that others may take them."""
+
+    @abstractmethod
+    def join(self, owner, ttl, now=None):
+        pass
+
+    @abstractmethod
+    def leave(self, owner):
+        """Stop counting the owner among the live ones."""
+
+    def close(self):
+        pass
+
+
+def choose_leases(keys, leases, owner, now, limit=None):
+    """The function decides which leases the owner takes and gives up.
+
+    `leases` maps keys to (owner, expires) pairs. Returns the keys to take
+    or renew and the keys held by the owner beyond the `limit`.
+    """
+    held = []
+    free = []
+    for key in keys:
+        current = leases.get(key)
+        if current is not None and current[0] == owner:
+            held.append(key)
+        elif current is None or current[1] <= now:
+            free.append(key)
+    if limit is None:
+        return held + free, []
+    room = max(limit - len(held), 0)
+    return held[:limit] + free[:room], held[limit:]
+
+
+class MemoryLeaseStore(LeaseStore):
+    """In-process stand-in for a Redis lease store.
+
+    Each lease works like `SET key owner NX PX ttl` plus a compare-and-set
+    renewal, so a store backed by Redis would implement the same calls.
+    """
+
+    def __init__(self):
+        self.leases = {}
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, keys, owner, ttl, now=None, limit=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            held, dropped = choose_leases(
+                keys, self.leases, owner, now, limit
+            )
+            for key in held:
+                self.leases[key] = (owner, now + ttl)
+            for key in dropped:
+                del self.leases[key]
+        return set(held)
+
+    def release(self, keys, owner):
+        with self.lock:
+            for key in keys:
+                if self.leases.get(key, (None,))[0] == owner:
+                    del self.leases[key]
+
+    def join(self, owner, ttl, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.owners[owner] = now + ttl
+            self.owners = {
+                name: expires for name, expires in self.owners.items()
+                if expires > now
+            }
+            return len(self.owners)
+
+    def leave(self, owner):
+        with self.lock:
+            self.owners.pop(owner, None)
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Lease store in an SQLite file shared by the replicas of one host.
+
+    Every call is a single immediate transaction, so the file lock of SQLite
+    makes taking a lease atomic across processes.
+    """
+
+    def __init__(self, path=LEASE_FILE, timeout=5):
+        self.path = path
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'key TEXT PRIMARY KEY, '
+            'owner TEXT NOT NULL, '
+            'expires REAL NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS owners ('
+            'owner TEXT PRIMARY KEY, '
+            'expires REAL NOT NULL)'
+        )
+        self.lock = threading.Lock()
+
+    def acquire(self, keys, owner, ttl, now=None, limit=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                leases = {
+                    key: (holder, expires)
+                    for key, holder, expires in self.connection.execute(
+                        'SELECT key, owner, expires FROM leases'
+                    )
+                }
+                held, dropped = choose_leases(
+                    keys, leases, owner, now, limit
+                )
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO leases (key, owner, expires) '
+                    'VALUES (?, ?, ?)',
+                    ((key, owner, now + ttl) for key in held),
+                )
+                self.connection.executemany(
+                    'DELETE FROM leases WHERE key = ?',
+                    ((key,) for key in dropped),
+                )
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        return set(held)
+
+    def release(self, keys, owner):
+        with self.lock:
+            self.connection.executemany(
+                'DELETE FROM leases WHERE key = ? AND owner = ?',
+                ((key, owner) for key in keys),
+            )
+
+    def join(self, owner, ttl, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO owners (owner, expires) '
+                    'VALUES (?, ?)', (owner, now + ttl),
+                )
+                self.connection.execute(
+                    'DELETE FROM owners WHERE expires <= ?', (now,)
+                )
+                (count,), = self.connection.execute(
+                    'SELECT COUNT(*) FROM owners'
+                )
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+        return count
+
+    def leave(self, owner):
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM owners WHERE owner = ?', (owner,)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def create_lease_store(kind=LEASE_STORE, path=LEASE_FILE):
+    """The function creates the lease store of the kind, or returns None."""
+    if not kind:
+        return None
+    if kind == 'sqlite':
+        return SQLiteLeaseStore(path)
+    if kind == 'memory':
+        return MemoryLeaseStore()
+    raise ValueError(f'Unknown lease store: {kind}')
+
+
+class LeaseKeeper:
+    """Leases of the subscriptions polled by this replica.
+
+    A lease counts as held until `ttl` after the moment its renewal was
+    requested, which is never later than the moment it expires in the
+    store, so a replica stops polling before another one may start.
+
+    With `fair_share` the replica counts among the live owners and holds no
+    more than its share of the keys, so every replica adds capacity.
+    """
+
+    def __init__(self, store, owner=None, ttl=LEASE_TTL, fair_share=True):
+        self.store = store
+        self.owner = owner or make_owner()
+        self.ttl = ttl
+        self.fair_share = fair_share
+        self.renew_interval = ttl / 3
+        self.deadlines = {}
+
+    def refresh(self, keys):
+        """Take or renew the leases; return the keys newly acquired."""
+        requested = time.monotonic()
+        limit = None
+        if self.fair_share:
+            keys = list(keys)
+            owners = self.store.join(self.owner, self.ttl)
+            limit = -(-len(keys) // owners)
+        held = self.store.acquire(keys, self.owner, self.ttl, limit=limit)
+        deadline = requested + self.ttl
+        acquired = held.difference(self.deadlines)
+        lost = set(self.deadlines).difference(held)
+        if lost:
+            logger.warning('Lost %s leases', len(lost))
+        if acquired:
+            logger.info('Acquired %s leases', len(acquired))
+        self.deadlines = dict.fromkeys(held, deadline)
+        return acquired
+
+    def holds(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        return self.deadlines.get(key, 0) > now
+
+    def release(self, keys=None):
+        """Give up the leases of the keys, every lease by default."""
+        if keys is None:
+            keys = list(self.deadlines)
+            if self.fair_share:
+                self.store.leave(self.owner)
+        self.store.release(keys, self.owner)
+        for key in keys:
+            self.deadlines.pop(key, None)
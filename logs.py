@@ -0,0 +1,82 @@
+import atexit
+import logging
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+import os
+import queue
+import sys
+
+
+LOG_FILE = os.getenv('LOG_FILE', 'main.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN')
+LOG_FORMAT = '%(asctime)s, %(levelname)s, %(message)s, %(name)s,'
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread.
+
+    The standard handler renders the message before queueing it; here the
+    record goes to the queue as is, so a logging call on the polling path
+    costs only a queue put.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LogListener(QueueListener):
+    """Queue listener that can be stopped more than once."""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+def make_file_handler(path=LOG_FILE):
+    """The function creates a rotating handler of the log file."""
+    if LOG_ROTATE_WHEN:
+        return TimedRotatingFileHandler(
+            path,
+            when=LOG_ROTATE_WHEN,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8',
+            delay=True,
+        )
+    return RotatingFileHandler(
+        path,
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8',
+        delay=True,
+    )
+
+
+def setup_logging(level=logging.INFO, path=LOG_FILE):
+    """The function routes all logging through a background listener.
+
+    Records are put to a queue by the root logger and written to stdout
+    and to the rotating log file by the listener thread, which is stopped
+    (and the queue flushed) at exit.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout), make_file_handler(path)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = LogListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,269 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http import HTTPStatus
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(labels):
+    """The function renders labels in the Prometheus text format."""
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    """Base class of a metric family with optional labels."""
+
+    type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        """Return the lines of the family in the text format."""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self.render_value(labels, value))
+        return lines
+
+    def render_value(self, labels, value):
+        return [f'{self.name}{format_labels(labels)} {value}']
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render_value(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            bucket_labels = labels + (('le', bound),)
+            lines.append(
+                f'{self.name}_bucket{format_labels(bucket_labels)} '
+                f'{cumulative}'
+            )
+        lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(labels)} {counts[-1]}')
+        return lines
+
+
+class Registry:
+    """Collection of metric families."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation):
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, buckets))
+
+    def add_collector(self, collector):
+        """Add a callable that refreshes gauges right before rendering."""
+        self.collectors.append(collector)
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        for collector in self.collectors:
+            collector()
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'homework_bot_stage_seconds', 'Time spent in each stage of the bot.'
+)
+ERRORS = REGISTRY.counter(
+    'homework_bot_errors_total', 'Errors by stage and exception class.'
+)
+POLLS = REGISTRY.counter(
+    'homework_bot_polls_total', 'Polls of the API by outcome.'
+)
+MESSAGES = REGISTRY.counter(
+    'homework_bot_messages_total', 'Telegram messages by outcome.'
+)
+LOOP_LAG = REGISTRY.histogram(
+    'homework_bot_loop_lag_seconds',
+    'How late polls start compared to their schedule.',
+)
+SUBSCRIPTIONS = REGISTRY.gauge(
+    'homework_bot_subscriptions', 'Subscriptions polled by this process.'
+)
+SUBSCRIPTION_BYTES = REGISTRY.gauge(
+    'homework_bot_subscription_bytes',
+    'Mean memory taken by the state of a subscription.',
+)
+SEND_BACKLOG = REGISTRY.gauge(
+    'homework_bot_send_backlog', 'Messages waiting to be sent.'
+)
+WORKERS_ALIVE = REGISTRY.gauge(
+    'homework_bot_workers', 'Worker processes that are running.'
+)
+WORKER_RESTARTS = REGISTRY.counter(
+    'homework_bot_worker_restarts_total', 'Worker processes restarted.'
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    'homework_bot_circuit_open', 'Whether requests to the API are suspended.'
+)
+DEADLINE_OVERRUNS = REGISTRY.counter(
+    'homework_bot_deadline_overruns_total',
+    'Polling iterations stopped by their deadline, by stage.',
+)
+HEDGES = REGISTRY.counter(
+    'homework_bot_hedged_requests_total',
+    'Second copies of slow API requests by outcome.',
+)
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the bot and count the errors raised in it."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as error:
+        ERRORS.inc(stage=name, error=type(error).__name__)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def metrics_handler(registry=REGISTRY):
+    """The function creates a request handler serving the registry.
+
+    `http.server` is imported here, so importing the metrics stays cheap.
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """Serves the registry at /metrics."""
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            body = registry.render().encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+    return MetricsHandler
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """The function serves the metrics from a background thread."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), metrics_handler())
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics-server', daemon=True
+    )
+    thread.start()
+    logger.info(
+        'Metrics are served at http://%s:%s/metrics', *server.server_address
+    )
+    return server
@@ -0,0 +1,91 @@
+import sys
+import types
+
+from homework import HOMEWORK_VERDICTS
+
+
+STATUSES = tuple(HOMEWORK_VERDICTS)
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType)
+
+
+def intern_name(name):
+    """The function interns a homework name or key so copies share memory."""
+    if isinstance(name, str):
+        return sys.intern(name)
+    return name
+
+
+class HomeworkRecord:
+    """Homework as an interned name and a status code instead of a dict.
+
+    Statuses missing from HOMEWORK_VERDICTS are kept as strings.
+    """
+
+    __slots__ = ('name', 'status')
+
+    def __init__(self, name, status):
+        self.name = name
+        self.status = status
+
+    @classmethod
+    def from_json(cls, homework):
+        status = homework.get('status')
+        return cls(
+            intern_name(homework.get('homework_name')),
+            STATUS_CODES.get(status, status),
+        )
+
+    @property
+    def status_name(self):
+        if isinstance(self.status, int):
+            return STATUSES[self.status]
+        return self.status
+
+    def __repr__(self):
+        return f'HomeworkRecord({self.name!r}, {self.status_name!r})'
+
+
+def compact_homeworks(homeworks):
+    """The function converts the homeworks of an answer to records."""
+    return [HomeworkRecord.from_json(homework) for homework in homeworks]
+
+
+def deep_sizeof(obj, seen=None):
+    """The function returns the size of the object and what it references.
+
+    Objects whose ids are in `seen` are not counted again, so sharing one
+    set across several objects counts shared strings and numbers once.
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, OPAQUE_TYPES):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        for cls in type(item).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(item, name):
+                    stack.append(getattr(item, name))
+        if hasattr(item, '__dict__'):
+            stack.append(item.__dict__)
+    return size
+
+
+def bytes_per_subscription(subscriptions):
+    """The function returns the mean memory footprint of a subscription."""
+    if not subscriptions:
+        return 0
+    seen = set()
+    total = sum(
+        deep_sizeof(subscription, seen) for subscription in subscriptions
+    )
+    return total / len(subscriptions)
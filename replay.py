@@ -0,0 +1,161 @@
+from collections import defaultdict, deque
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+logger = logging.getLogger(__name__)
+
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def token_key(headers):
+    """The function returns a digest of the Authorization header."""
+    authorization = (headers or {}).get('Authorization', '')
+    return hashlib.sha256(authorization.encode()).hexdigest()[:16]
+
+
+class RecordingClient:
+    """Client wrapper that writes every API exchange to a capture file.
+
+    The capture is a gzip-compressed JSON lines file: request time offset,
+    a digest of the token, `from_date`, the duration of the request and the
+    status, headers and body of the answer. Tokens are never written.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.file = gzip.open(path, 'at', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        logger.info('Recording API traffic to %s', path)
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        """Send the request and record the exchange."""
+        record = {
+            't': round(time.monotonic() - self.started, 6),
+            'key': token_key(headers),
+            'from_date': (params or {}).get('from_date'),
+        }
+        started = time.perf_counter()
+        try:
+            response = self.client.get(
+                url, headers=headers, params=params, **kwargs
+            )
+            body = response.content
+        except requests.RequestException as error:
+            record['elapsed'] = round(time.perf_counter() - started, 6)
+            record['error'] = str(error)
+            self.write(record)
+            raise
+        record['elapsed'] = round(time.perf_counter() - started, 6)
+        record['status'] = response.status_code
+        record['reason'] = response.reason
+        record['headers'] = {
+            name: response.headers[name]
+            for name in RECORDED_HEADERS if name in response.headers
+        }
+        record['body'] = body.decode('utf-8', errors='replace')
+        self.write(record)
+        return response
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.client.close()
+
+
+def load_capture(path):
+    """The function reads the records of a capture file.
+
+    A capture cut short by a crash is read up to its last complete record.
+    """
+    records = []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as capture:
+            for line in capture:
+                if line.endswith('\n'):
+                    records.append(json.loads(line))
+    except EOFError:
+        logger.warning('Capture %s is truncated', path)
+    return records
+
+
+class ReplayResponse:
+    """Recorded answer that behaves like `requests.Response`."""
+
+    def __init__(self, record):
+        self.status_code = record['status']
+        self.reason = record.get('reason', '')
+        self.headers = CaseInsensitiveDict(record.get('headers', {}))
+        self.content = record['body'].encode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class ReplayClient:
+    """Client that answers from a capture file instead of the network.
+
+    Records are served per token in the order they were recorded, after a
+    delay equal to the recorded request duration divided by `speed`
+    (`speed=0` answers at once). With `loop` the records of a token start
+    over once they are exhausted.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True):
+        self.speed = speed
+        self.loop = loop
+        self.records = defaultdict(list)
+        for record in load_capture(path):
+            self.records[record['key']].append(record)
+        self.queues = {}
+        self.lock = threading.Lock()
+        logger.info(
+            'Replaying %s tokens from %s', len(self.records), path
+        )
+
+    def next_record(self, key):
+        with self.lock:
+            queue = self.queues.get(key)
+            if not queue:
+                if key not in self.records or (
+                    key in self.queues and not self.loop
+                ):
+                    raise requests.ConnectionError(
+                        'No recorded answers left for the token'
+                    )
+                queue = self.queues[key] = deque(self.records[key])
+            return queue.popleft()
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        """Return the next recorded answer for the token."""
+        record = self.next_record(token_key(headers))
+        if self.speed:
+            time.sleep(record['elapsed'] / self.speed)
+        if 'error' in record:
+            raise requests.ConnectionError(record['error'])
+        return ReplayResponse(record)
+
+    def close(self):
+        pass
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import random
+import time
+
+from homework import RETRY_TIME
+
+
+REVIEWING_RETRY_TIME = 120
+IDLE_RETRY_TIME = 1800
+IDLE_AFTER = 6 * 60 * 60
+ERROR_RETRY_TIME = 30
+MAX_ERROR_RETRY_TIME = 3600
+JITTER = 0.1
+
+TERMINAL_STATUSES = ('approved',)
+REMOVED = object()
+
+
+class AdaptiveSchedule:
+    """Picks the delay before the next poll of a subscription.
+
+    Works under review are polled more often, subscriptions without changes
+    for a long time or with a terminal status are polled less often and
+    failing ones back off exponentially.
+    """
+
+    def __init__(self, retry_time=RETRY_TIME,
+                 reviewing_retry_time=REVIEWING_RETRY_TIME,
+                 idle_retry_time=IDLE_RETRY_TIME, idle_after=IDLE_AFTER,
+                 error_retry_time=ERROR_RETRY_TIME,
+                 max_error_retry_time=MAX_ERROR_RETRY_TIME, jitter=JITTER):
+        self.retry_time = retry_time
+        self.reviewing_retry_time = reviewing_retry_time
+        self.idle_retry_time = idle_retry_time
+        self.idle_after = idle_after
+        self.error_retry_time = error_retry_time
+        self.max_error_retry_time = max_error_retry_time
+        self.jitter = jitter
+
+    def base_delay(self, subscription, now=None):
+        """Return the delay without jitter."""
+        if subscription.error_count:
+            return min(
+                self.error_retry_time * 2 ** (subscription.error_count - 1),
+                self.max_error_retry_time,
+            )
+        if subscription.last_status == 'reviewing':
+            return self.reviewing_retry_time
+        if subscription.last_status in TERMINAL_STATUSES:
+            return self.idle_retry_time
+        now = time.monotonic() if now is None else now
+        if now - subscription.last_change >= self.idle_after:
+            return self.idle_retry_time
+        return self.retry_time
+
+    def next_delay(self, subscription, now=None):
+        """Return the delay before the next poll in seconds."""
+        delay = self.base_delay(subscription, now)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def first_delay(self, subscription):
+        """Return the delay before the first poll in seconds.
+
+        The delays are spread evenly over one retry period by the key of
+        the subscription, so a restart does not poll everybody at once and
+        every subscription keeps its phase between restarts.
+        """
+        return self.retry_time * int(subscription.key[:8], 16) / 0x100000000
+
+
+class PollQueue:
+    """Due times of the subscriptions in a binary heap.
+
+    Rescheduling pushes a new entry and marks the old one as removed
+    instead of searching for it, so push, remove and pop are O(log n).
+    Removed entries are dropped when they reach the top of the heap or
+    when they outnumber the live ones.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.removed = 0
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return item in self.entries
+
+    def push(self, item, due):
+        """Schedule the item, replacing its previous due time."""
+        self.remove(item)
+        entry = [due, next(self.counter), item]
+        self.entries[item] = entry
+        heapq.heappush(self.heap, entry)
+
+    def remove(self, item):
+        entry = self.entries.pop(item, None)
+        if entry is None:
+            return
+        entry[2] = REMOVED
+        self.removed += 1
+        if self.removed > len(self.entries):
+            self.heap = [
+                entry for entry in self.heap if entry[2] is not REMOVED
+            ]
+            heapq.heapify(self.heap)
+            self.removed = 0
+
+    def peek(self):
+        """Return the earliest due time, or None if the queue is empty."""
+        while self.heap and self.heap[0][2] is REMOVED:
+            heapq.heappop(self.heap)
+            self.removed -= 1
+        if not self.heap:
+            return None
+        return self.heap[0][0]
+
+    def pop_due(self, now=None):
+        """Remove and return the earliest (item, due) pair if it is due."""
+        now = time.monotonic() if now is None else now
+        due = self.peek()
+        if due is None or due > now:
+            return None
+        _, _, item = heapq.heappop(self.heap)
+        del self.entries[item]
+        return item, due
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import sqlite3
+
+from records import STATUS_CODES, STATUSES, intern_name
+
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.getenv('STATE_FILE', 'state.sqlite3')
+
+
+class StateStore:
+    """SQLite storage of the polling cursor and the last sent report.
+
+    Every save is a single transaction, so a crash leaves either the old
+    or the new state of a subscription on disk, never a mix of both.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS subscriptions ('
+                'key TEXT PRIMARY KEY, '
+                'from_date INTEGER NOT NULL, '
+                'report TEXT NOT NULL)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS homework_statuses ('
+                'key TEXT NOT NULL, '
+                'homework TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'PRIMARY KEY (key, homework))'
+            )
+
+    def load(self, subscription):
+        """Restore the saved state of the subscription, if there is one."""
+        row = self.connection.execute(
+            'SELECT from_date, report FROM subscriptions WHERE key = ?',
+            (subscription.key,),
+        ).fetchone()
+        if row is None:
+            return False
+        subscription.current_timestamp = row[0]
+        subscription.previous_report = json.loads(row[1]).get('message')
+        subscription.statuses = {
+            intern_name(homework): STATUS_CODES[status]
+            for homework, status in self.connection.execute(
+                'SELECT homework, status FROM homework_statuses '
+                'WHERE key = ?',
+                (subscription.key,),
+            )
+            if status in STATUS_CODES
+        }
+        return True
+
+    def save(self, subscription, changes=()):
+        """Persist the state of the subscription.
+
+        Only the homework statuses from `changes`, a sequence of
+        (homework, status code, ...) tuples, are written. Statuses and the
+        report are stored as text, as in the API answers.
+        """
+        report = {}
+        if subscription.previous_report is not None:
+            report = {'message': subscription.previous_report}
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO homework_statuses '
+                '(key, homework, status) VALUES (?, ?, ?)',
+                (
+                    (subscription.key, change[0], STATUSES[change[1]])
+                    for change in changes
+                ),
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO subscriptions '
+                '(key, from_date, report) VALUES (?, ?, ?)',
+                (
+                    subscription.key,
+                    subscription.current_timestamp,
+                    json.dumps(report),
+                ),
+            )
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
@@ -0,0 +1,138 @@
+import codecs
+import json
+
+from exceptions import EmptyAPIReply
+
+
+CHUNK_SIZE = 16 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class HomeworkStream:
+    """Incremental parser of a homework_statuses response body.
+
+    Iterating over the stream yields homework dicts one by one while the
+    body is still being downloaded, so the whole history never has to be in
+    memory at once. The shape of the answer is checked the same way as
+    `check_response()` does it. `current_date` and the first (latest)
+    homework are available once the stream is exhausted.
+    """
+
+    def __init__(self, chunks, close=None):
+        self.chunks = iter(chunks)
+        self.close = close
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.current_date = None
+        self.first = None
+        self.count = 0
+
+    def __iter__(self):
+        try:
+            yield from self.parse()
+        finally:
+            if self.close is not None:
+                self.close()
+
+    def read(self):
+        """Append the next chunk to the buffer; return False at the end."""
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            if self.position:
+                self.buffer = self.buffer[self.position:]
+                self.position = 0
+            text = self.decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.decoder.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Return the next non-whitespace character or '' at the end."""
+        while True:
+            while (self.position < len(self.buffer)
+                   and self.buffer[self.position] in WHITESPACE):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read():
+                return ''
+
+    def expect(self, *characters):
+        """Consume one of the characters and return it."""
+        character = self.peek()
+        if character not in characters or not character:
+            raise ValueError(
+                f'Unexpected {character!r} in the API response, '
+                f'expected one of {characters}'
+            )
+        self.position += 1
+        return character
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except json.JSONDecodeError:
+                if not self.read():
+                    raise
+                continue
+            if end == len(self.buffer) and self.read():
+                continue
+            self.position = end
+            return value
+
+    def parse(self):
+        """Yield homeworks while checking the shape of the answer."""
+        if self.peek() != '{':
+            raise TypeError('Answer is not a dictionary')
+        self.expect('{')
+        has_homeworks = False
+        if self.peek() == '}':
+            self.expect('}')
+        else:
+            while True:
+                key = self.value()
+                self.expect(':')
+                if key == 'homeworks':
+                    has_homeworks = True
+                    yield from self.homeworks()
+                elif key == 'current_date':
+                    self.current_date = self.value()
+                else:
+                    self.value()
+                if self.expect(',', '}') == '}':
+                    break
+        if self.peek():
+            raise ValueError('Extra data after the API response')
+        if not has_homeworks:
+            raise EmptyAPIReply('Empty response from API')
+
+    def homeworks(self):
+        """Yield the items of the homeworks list."""
+        if self.peek() != '[':
+            raise KeyError('Answer is not a list')
+        self.expect('[')
+        if self.peek() == ']':
+            self.expect(']')
+            return
+        while True:
+            homework = self.value()
+            if not isinstance(homework, dict):
+                raise TypeError('Homework is not a dictionary')
+            if self.first is None:
+                self.first = homework
+            self.count += 1
+            yield homework
+            if self.expect(',', ']') == ']':
+                return
@@ -0,0 +1,494 @@
+from bisect import bisect
+import hashlib
+import logging
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+
+from analytics import ReviewAnalytics
+from commands import CommandListener, StatusCache, StatusService
+from dispatcher import TELEGRAM_GLOBAL_RATE, TelegramDispatcher
+import engine
+from hedging import HEDGE_RATE
+from history import HISTORY_FILE
+import homework
+from leases import LeaseKeeper, create_lease_store, replica_path
+from logs import LOG_FILE, setup_logging
+from metrics import (
+    METRICS_PORT,
+    REGISTRY,
+    SEND_BACKLOG,
+    SUBSCRIPTIONS,
+    WORKER_RESTARTS,
+    WORKERS_ALIVE,
+    start_metrics_server,
+)
+
+
+logger = logging.getLogger(__name__)
+
+RING_REPLICAS = 100
+CHECK_INTERVAL = 1
+RESTART_BACKOFF = 1
+MAX_RESTART_BACKOFF = 60
+STOP_TIMEOUT = 10
+
+
+def ring_hash(value):
+    """The function maps a string to a point of the hash ring."""
+    return int.from_bytes(hashlib.sha256(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring of worker indexes.
+
+    Every worker owns `replicas` points of the ring and a key belongs to the
+    owner of the first point after the hash of the key, so adding or removing
+    a worker moves only the keys next to its points.
+    """
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        points = sorted(
+            (ring_hash(f'{node}:{replica}'), node)
+            for node in nodes for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self.nodes:
+            raise ValueError('The hash ring is empty')
+        index = bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.nodes[index]
+
+
+def shard_roster(subscriptions, workers):
+    """The function splits the subscriptions between the workers.
+
+    Returns a tuple of (practicum_token, chat_id) entries for every worker.
+    """
+    ring = HashRing(range(workers))
+    shards = [[] for _ in range(workers)]
+    for subscription in subscriptions:
+        shards[ring.node_for(subscription.key)].append(
+            (subscription.practicum_token, subscription.chat_id)
+        )
+    return [tuple(shard) for shard in shards]
+
+
+class ShardReceiver:
+    """Shard updates sent to a worker by the supervisor through a pipe.
+
+    New shares of the Telegram and hedging rates come the same way after
+    the number of workers has changed and are passed to `on_rates`.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.on_rates = None
+
+    def reload(self, force=False):
+        """Return the subscriptions of the latest shard, None if unchanged."""
+        entries = None
+        try:
+            while self.connection is not None and self.connection.poll():
+                kind, *args = self.connection.recv()
+                if kind == 'shard':
+                    entries, = args
+                elif kind == 'rates' and self.on_rates is not None:
+                    self.on_rates(*args)
+        except (EOFError, OSError) as error:
+            logger.error('Lost the connection to the supervisor: %r', error)
+            self.connection = None
+        if entries is None:
+            return None
+        return [
+            engine.Subscription(token, chat_id) for token, chat_id in entries
+        ]
+
+
+class SupervisorLink:
+    """Sends what the supervisor needs for the bot commands up the pipe."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def send(self, message):
+        if self.connection is None:
+            return
+        try:
+            self.connection.send(message)
+        except (OSError, ValueError) as error:
+            logger.error('Lost the connection to the supervisor: %r', error)
+            self.connection = None
+
+
+class ForwardingStatusCache(StatusCache):
+    """Status cache of a worker that passes its updates to the supervisor.
+
+    The supervisor answers /status, so its cache has to follow the polls
+    of every worker.
+    """
+
+    def __init__(self, link):
+        super().__init__()
+        self.link = link
+
+    def update(self, token, records, snapshot=False, now=None):
+        super().update(token, records, snapshot, now)
+        self.link.send(('statuses', token, records, snapshot))
+
+    def touch(self, token, now=None):
+        super().touch(token, now)
+        self.link.send(('touch', token))
+
+
+class ForwardingAnalytics:
+    """Analytics of a worker: the transitions go to the supervisor.
+
+    The supervisor answers /report for every subscription, so it feeds
+    the transitions of all workers into one ReviewAnalytics.
+    """
+
+    def __init__(self, link):
+        self.link = link
+
+    def observe(self, subscription, transitions, now=None, snapshot=False):
+        now = time.time() if now is None else now
+        self.link.send(
+            ('transitions', subscription, transitions, now, snapshot)
+        )
+
+
+def run_worker(index, entries, workers, connection=None):
+    """The function polls one shard of the roster in a worker process.
+
+    Later versions of the shard arrive through the `connection` and are
+    applied without a restart; the status updates and the transitions
+    found by the polls go back to the supervisor through it.
+    """
+    homework.init()
+    setup_logging(path=replica_path(f'{LOG_FILE}.worker-{index}'))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    subscriptions = [
+        engine.Subscription(token, chat_id) for token, chat_id in entries
+    ]
+    link = SupervisorLink(connection)
+    logger.info(
+        'Worker %s polls %s subscriptions', index, len(subscriptions)
+    )
+    engine.serve(
+        subscriptions,
+        commands=False,
+        global_rate=TELEGRAM_GLOBAL_RATE / (workers + 1),
+        metrics_port=METRICS_PORT and METRICS_PORT + 1 + index,
+        history_path=HISTORY_FILE and f'{HISTORY_FILE}.worker-{index}',
+        hedge_rate=HEDGE_RATE / workers,
+        roster=connection and ShardReceiver(connection),
+        status_cache=connection and ForwardingStatusCache(link),
+        analytics=connection and ForwardingAnalytics(link),
+    )
+
+
+class WorkerSlot:
+    """A worker process and the shard of the roster it polls."""
+
+    def __init__(self, index, entries):
+        self.index = index
+        self.entries = entries
+        self.process = None
+        self.connection = None
+        self.started = 0
+        self.failures = 0
+        self.restart_at = 0
+
+
+class Supervisor:
+    """Runs the polling engine in worker processes, a shard of the roster each.
+
+    Dead workers are restarted with a growing delay. When the roster file
+    changes, or on SIGHUP, the roster is sharded again and the workers get
+    their new shards through pipes: with the same number of workers a
+    subscription never moves to another worker, so the workers just start
+    and stop polling the added and removed ones. When the number of workers
+    is changed with SIGTTIN / SIGTTOU, the workers whose shard has changed
+    are restarted and the others get their new share of the Telegram and
+    hedging rates. The supervisor process itself answers the bot commands.
+    Workers write the transition history to `HISTORY_FILE.worker-N`.
+    """
+
+    def __init__(self, subscriptions, workers, roster_path=engine.ROSTER_FILE,
+                 target=run_worker, context=None):
+        self.subscriptions = list(subscriptions)
+        self.workers = workers
+        self.roster = engine.RosterFile(roster_path)
+        self.reload_forced = False
+        self.target = target
+        self.context = context or multiprocessing.get_context('spawn')
+        self.slots = []
+        self.listener = None
+        self.dispatcher = None
+        self.status_cache = StatusCache()
+        self.analytics = ReviewAnalytics()
+        self.resize = 0
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+
+    @property
+    def alive(self):
+        """Number of running worker processes."""
+        return sum(
+            slot.process is not None and slot.process.is_alive()
+            for slot in self.slots
+        )
+
+    def spawn(self, slot):
+        receiver, slot.connection = self.context.Pipe()
+        slot.process = self.context.Process(
+            target=self.target,
+            args=(slot.index, slot.entries, self.workers, receiver),
+            name=f'worker-{slot.index}',
+        )
+        slot.process.start()
+        receiver.close()
+        slot.started = time.monotonic()
+        logger.info(
+            'Worker %s started (pid %s) with %s subscriptions',
+            slot.index, slot.process.pid, len(slot.entries),
+        )
+
+    def stop_slots(self, slots, timeout=STOP_TIMEOUT):
+        """Terminate the workers of the slots and wait for them to exit."""
+        processes = [slot.process for slot in slots if slot.process]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error('Worker %s did not stop, killing', process.name)
+                process.kill()
+                process.join()
+        for slot in slots:
+            slot.process = None
+            if slot.connection is not None:
+                slot.connection.close()
+                slot.connection = None
+
+    def send_shards(self, shards):
+        """Send the changed shards to the workers of the slots.
+
+        Workers left without subscriptions are stopped and the ones that
+        have got their first are started by `check_workers()`.
+        """
+        changed = 0
+        for slot in self.slots:
+            entries = shards[slot.index]
+            if set(entries) == set(slot.entries):
+                continue
+            changed += 1
+            slot.entries = entries
+            if not entries:
+                self.stop_slots([slot])
+            else:
+                self.send(slot, ('shard', entries))
+        return changed
+
+    def send(self, slot, message):
+        if slot.connection is None:
+            return
+        try:
+            slot.connection.send(message)
+        except (OSError, ValueError) as error:
+            logger.error(
+                'Failed to send %s to worker %s: %s',
+                message[0], slot.index, error,
+            )
+
+    def rebalance(self, subscriptions, workers):
+        """Shard the roster again and hand the shards to the workers.
+
+        With the same number of workers the running workers get their new
+        shards. Otherwise the workers losing subscriptions are restarted,
+        and stopped before any worker starts, so a subscription is never
+        polled by two processes at once; the kept ones get their share of
+        the rates for the new number and the subscriptions they gain.
+        """
+        shards = shard_roster(subscriptions, workers)
+        if self.slots and workers == self.workers:
+            changed = self.send_shards(shards)
+            self.roster_changed(subscriptions)
+            logger.info(
+                '%s subscriptions resharded, %s workers updated',
+                len(subscriptions), changed,
+            )
+            return
+        changed = [
+            slot for slot in self.slots
+            if slot.index >= workers
+            or not set(shards[slot.index]).issuperset(slot.entries)
+        ]
+        self.stop_slots(changed)
+        self.slots = [slot for slot in self.slots if slot not in changed]
+        self.set_workers(workers)
+        self.send_shards(shards)
+        kept = {slot.index for slot in self.slots}
+        for index, entries in enumerate(shards):
+            if index in kept:
+                continue
+            slot = WorkerSlot(index, entries)
+            self.slots.append(slot)
+            if entries:
+                self.spawn(slot)
+        self.slots.sort(key=lambda slot: slot.index)
+        self.roster_changed(subscriptions)
+        logger.info(
+            '%s subscriptions sharded across %s workers, %s restarted',
+            len(subscriptions), workers, len(changed),
+        )
+
+    def set_workers(self, workers):
+        """Split the rates between the new number of workers."""
+        self.workers = workers
+        global_rate = TELEGRAM_GLOBAL_RATE / (workers + 1)
+        if self.dispatcher is not None:
+            self.dispatcher.global_bucket.set_rate(global_rate)
+        for slot in self.slots:
+            self.send(slot, ('rates', global_rate, HEDGE_RATE / workers))
+
+    def collect_updates(self):
+        """Apply the status updates that the workers have sent."""
+        for slot in self.slots:
+            connection = slot.connection
+            try:
+                while connection is not None and connection.poll():
+                    self.apply_update(connection.recv())
+            except (EOFError, OSError) as error:
+                # the exit of the worker is reported by check_workers()
+                logger.debug(
+                    'Worker %s has closed its pipe: %r', slot.index, error
+                )
+
+    def apply_update(self, message):
+        kind, *args = message
+        if kind == 'statuses':
+            self.status_cache.update(*args)
+        elif kind == 'touch':
+            self.status_cache.touch(*args)
+        elif kind == 'transitions':
+            subscription, transitions, now, snapshot = args
+            self.analytics.observe(
+                subscription, transitions, now=now, snapshot=snapshot
+            )
+
+    def roster_changed(self, subscriptions):
+        self.subscriptions = list(subscriptions)
+        if self.listener is not None:
+            self.listener.set_roster(self.subscriptions)
+        SUBSCRIPTIONS.set(len(self.subscriptions))
+
+    def check_workers(self, now=None):
+        """Restart the workers that have exited, backing off on crash loops."""
+        now = time.monotonic() if now is None else now
+        for slot in self.slots:
+            process = slot.process
+            if not slot.entries:
+                continue
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                if now - slot.started < MAX_RESTART_BACKOFF:
+                    slot.failures += 1
+                else:
+                    slot.failures = 1
+                delay = min(
+                    RESTART_BACKOFF * 2 ** (slot.failures - 1),
+                    MAX_RESTART_BACKOFF,
+                )
+                slot.restart_at = now + delay
+                slot.process = None
+                WORKER_RESTARTS.inc()
+                logger.error(
+                    'Worker %s (pid %s) exited with code %s, '
+                    'restarting in %s s',
+                    slot.index, process.pid, process.exitcode, delay,
+                )
+            if now >= slot.restart_at:
+                self.spawn(slot)
+
+    def reload_roster(self, force=False):
+        """Reshard if the roster file has changed since it was loaded."""
+        subscriptions = self.roster.reload(force)
+        if subscriptions is not None:
+            self.rebalance(subscriptions, self.workers)
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGTTIN:
+            self.resize += 1
+        elif signum == signal.SIGTTOU:
+            self.resize -= 1
+        elif signum == signal.SIGHUP:
+            self.reload_forced = True
+        else:
+            self.stopped.set()
+        self.wakeup.set()
+
+    def tick(self, now):
+        """Apply pending resizes and roster changes, restart dead workers."""
+        if self.resize:
+            workers = max(self.workers + self.resize, 1)
+            self.resize = 0
+            if workers != self.workers:
+                logger.warning(
+                    'Resizing from %s to %s workers', self.workers, workers
+                )
+                self.rebalance(self.subscriptions, workers)
+        force, self.reload_forced = self.reload_forced, False
+        self.reload_roster(force)
+        self.collect_updates()
+        self.check_workers(now)
+
+    def run(self):
+        """Supervise the workers until SIGTERM or SIGINT."""
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                       signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self.handle_signal)
+        bot = engine.make_bot()
+        dispatcher = self.dispatcher = TelegramDispatcher(
+            bot, global_rate=TELEGRAM_GLOBAL_RATE / (self.workers + 1)
+        )
+        dispatcher.start()
+        if METRICS_PORT:
+            REGISTRY.add_collector(
+                lambda: SEND_BACKLOG.set(dispatcher.backlog)
+            )
+            REGISTRY.add_collector(lambda: WORKERS_ALIVE.set(self.alive))
+            start_metrics_server(METRICS_PORT)
+        lease_store = create_lease_store()
+        if engine.COMMANDS_ENABLED:
+            self.listener = CommandListener(
+                bot, self.subscriptions, dispatcher,
+                StatusService(self.status_cache), self.analytics,
+                lease=lease_store and LeaseKeeper(
+                    lease_store, fair_share=False
+                ),
+            )
+            self.listener.start()
+        try:
+            self.rebalance(self.subscriptions, self.workers)
+            while not self.stopped.is_set():
+                self.wakeup.wait(CHECK_INTERVAL)
+                self.wakeup.clear()
+                self.tick(time.monotonic())
+        finally:
+            logger.info('Stopping %s workers', self.alive)
+            self.stop_slots(self.slots)
+            if self.listener is not None:
+                self.listener.stop()
+            dispatcher.stop()
+            if lease_store is not None:
+                lease_store.close()
@@ -0,0 +1,81 @@
+import asyncio
+import random
+
+from analytics import P2Quantile, ReviewAnalytics
+import commands
+import engine
+from records import STATUS_CODES
+from test_commands import MockDispatcher
+from test_engine import MockBot, make_answer, mock_fetch
+
+REVIEWING = STATUS_CODES['reviewing']
+APPROVED = STATUS_CODES['approved']
+REJECTED = STATUS_CODES['rejected']
+
+
+class TestAnalytics:
+
+    def test_p2_quantiles_are_close_to_exact(self):
+        generator = random.Random(1)
+        values = [generator.expovariate(1 / 3600) for _ in range(20000)]
+        ordered = sorted(values)
+        for p in (0.5, 0.9, 0.99):
+            sketch = P2Quantile(p)
+            for value in values:
+                sketch.add(value)
+            exact = ordered[int(p * len(ordered))]
+            assert abs(sketch.value() - exact) / exact < 0.05
+        small = P2Quantile(0.5)
+        assert small.value() is None
+        for value in (3, 1, 2):
+            small.add(value)
+        assert small.value() == 2
+
+    def test_reviews_are_timed_from_submission_to_verdict(self):
+        analytics = ReviewAnalytics()
+        analytics.observe('a', [('1', None, REVIEWING)], now=0,
+                          snapshot=True)
+        analytics.observe('a', [('2', None, REVIEWING)], now=0)
+        analytics.observe('b', [('2', None, REVIEWING)], now=100)
+        analytics.observe('a', [('1', REVIEWING, APPROVED),
+                                ('2', REVIEWING, REJECTED)], now=600)
+        report = analytics.report()
+        assert report['submitted'] == 3
+        assert report['in_review'] == 1
+        assert (report['approved'], report['rejected']) == (1, 1)
+        assert report['timed'] == 1
+        assert report['quantiles'][0.5] == 600
+        assert commands.render_report(report).splitlines()[-3:] == [
+            'p50: 0h 10m', 'p90: 0h 10m', 'p99: 0h 10m',
+        ]
+
+    def test_engine_feeds_the_report_command(self, monkeypatch):
+        mock_fetch(monkeypatch, [
+            make_answer(current_date=100),
+            make_answer({'id': 1, 'homework_name': 'hw1',
+                         'status': 'reviewing'}, current_date=200),
+            make_answer({'id': 1, 'homework_name': 'hw1',
+                         'status': 'approved'}, current_date=300),
+        ])
+        analytics = ReviewAnalytics()
+        subscription = engine.Subscription('token', 1)
+        polling = engine.PollingEngine(
+            MockBot(), [subscription], analytics=analytics
+        )
+
+        async def poll_three_times():
+            for _ in range(3):
+                await polling.poll(subscription)
+
+        asyncio.run(poll_three_times())
+        dispatcher = MockDispatcher()
+        listener = commands.CommandListener(
+            None, [subscription], dispatcher, analytics=analytics
+        )
+        listener.answer_report(1)
+        listener.stop()
+        [(chat_id, message)] = dispatcher.sent
+        assert message.startswith(
+            'Sent for review: 1, under review: 0\nApproved: 1, rejected: 0\n'
+            'Time in review of 1 works'
+        )
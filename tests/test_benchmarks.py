@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks')
+)
+
+import bench_import  # noqa: E402
+import bench_polling  # noqa: E402
+
+
+class TestBenchmarkHarness:
+
+    def test_polls_the_stub_servers(self, monkeypatch):
+        import homework
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        report = bench_polling.run(bench_polling.parse_args([
+            '--subscriptions', '3', '--duration', '1', '--interval', '0.1',
+        ]))
+        assert report['polls'] >= 3
+        assert report['api_requests'] >= report['polls']
+        assert report['messages'] >= 3
+
+
+class TestImportTime:
+
+    def test_homework_import_is_light(self, tmp_path):
+        times = bench_import.import_times('homework', cwd=str(tmp_path))
+        assert 'homework' in times
+        assert bench_import.heavy_imports(times) == []
+        assert list(tmp_path.iterdir()) == [], (
+            'Importing homework must not create any files'
+        )
+
+    def test_init_reads_tokens(self, monkeypatch):
+        import homework
+        for name in ('PRACTICUM_TOKEN', 'TELEGRAM_TOKEN', 'TELEGRAM_CHAT_ID',
+                     'HEADERS', 'TOKENS'):
+            monkeypatch.setattr(homework, name, getattr(homework, name))
+        monkeypatch.setenv('PRACTICUM_TOKEN', 'token')
+        monkeypatch.setenv('TELEGRAM_CHAT_ID', '42')
+        homework.init()
+        assert homework.PRACTICUM_TOKEN == 'token'
+        assert homework.TELEGRAM_CHAT_ID == '42'
+        assert homework.HEADERS == {'Authorization': 'OAuth token'}
@@ -0,0 +1,98 @@
+import asyncio
+
+import requests
+
+import breaker
+import engine
+from exceptions import InvalidResponseCode, ServerError
+from test_engine import MockBot
+
+
+class MockDispatcher:
+
+    def __init__(self):
+        self.offered = []
+
+    def offer(self, chat_id, message):
+        self.offered.append((chat_id, message))
+        return True
+
+
+class TestBreaker:
+
+    def test_opens_after_threshold_and_recovers(self):
+        changes = []
+        circuit = breaker.CircuitBreaker(
+            'api', failure_threshold=3, recovery_time=10,
+            on_change=lambda _, state: changes.append(state),
+        )
+        for _ in range(3):
+            assert circuit.allow(now=0)
+            circuit.record_failure()
+        assert circuit.state == breaker.OPEN
+        circuit.opened_at = 0
+        assert not circuit.allow(now=5)
+        assert circuit.allow(now=11)
+        assert not circuit.allow(now=11), 'Only one probe is allowed'
+        circuit.record_success()
+        assert circuit.state == breaker.CLOSED
+        assert changes == [breaker.OPEN, breaker.HALF_OPEN, breaker.CLOSED]
+
+    def test_failed_probe_opens_again(self):
+        circuit = breaker.CircuitBreaker(
+            'api', failure_threshold=1, recovery_time=10
+        )
+        circuit.record_failure()
+        circuit.opened_at = 0
+        assert circuit.allow(now=10)
+        circuit.record_failure()
+        assert circuit.state == breaker.OPEN
+
+    def test_is_outage(self):
+        assert breaker.is_outage(requests.ConnectionError())
+        assert breaker.is_outage(ServerError())
+        assert not breaker.is_outage(InvalidResponseCode())
+        try:
+            try:
+                raise requests.Timeout()
+            except requests.Timeout as error:
+                raise ConnectionError('wrapped') from error
+        except ConnectionError as error:
+            assert breaker.is_outage(error)
+
+    def test_engine_sends_one_outage_message(self, monkeypatch):
+        def fetch_api_response(token, timestamp, validators, stream):
+            raise ConnectionError('down') from ServerError('502')
+
+        monkeypatch.setattr(engine, 'fetch_api_response', fetch_api_response)
+        monkeypatch.setattr(engine, 'OUTAGE_CHAT_ID', 'admin')
+        dispatcher = MockDispatcher()
+        circuit = breaker.CircuitBreaker(
+            'api', failure_threshold=2, recovery_time=60
+        )
+        subscriptions = [engine.Subscription(str(i), i) for i in range(5)]
+        polling = engine.PollingEngine(
+            MockBot(), subscriptions, dispatcher=dispatcher, breaker=circuit
+        )
+
+        async def poll_all():
+            for subscription in subscriptions:
+                await polling.poll(subscription)
+
+        asyncio.run(poll_all())
+        assert circuit.state == breaker.OPEN
+        message = engine.OUTAGE_MESSAGES[breaker.OPEN]
+        assert dispatcher.offered == [('admin', message)]
+        assert [s.error_count for s in subscriptions] == [1, 1, 0, 0, 0]
+        for _ in range(3):
+            circuit.opened_at = 0
+            assert circuit.allow()
+            circuit.record_failure()
+        assert dispatcher.offered == [('admin', message)]
+        circuit.opened_at = 0
+        assert circuit.allow()
+        circuit.record_success()
+        assert dispatcher.offered == [
+            ('admin', message),
+            ('admin', engine.OUTAGE_MESSAGES[breaker.CLOSED]),
+        ]
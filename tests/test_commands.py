@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from analytics import ReviewAnalytics
+from breaker import CircuitBreaker
+import commands
+from deadline import current_deadline
+import engine
+from exceptions import CircuitOpen
+from leases import LeaseKeeper, MemoryLeaseStore
+from test_engine import MockBot, make_answer, mock_fetch
+
+
+class MockDispatcher:
+
+    def __init__(self):
+        self.sent = []
+
+    def submit(self, chat_id, message):
+        self.sent.append((chat_id, message))
+
+
+class TestStatusCommand:
+
+    def test_concurrent_refreshes_share_one_request(self, monkeypatch):
+        requests = []
+        release = threading.Event()
+
+        def fetch_api_answer(token, timestamp):
+            requests.append((token, timestamp))
+            release.wait(5)
+            return {'homeworks': [
+                {'homework_name': 'hw1', 'status': 'approved'}
+            ]}
+
+        monkeypatch.setattr(commands, 'fetch_api_answer', fetch_api_answer)
+        service = commands.StatusService()
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(service.homeworks('token'))
+            )
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert requests == [('token', 0)]
+        assert len(results) == 10
+        service.homeworks('token')
+        assert len(requests) == 1
+        service.cache.invalidate('token')
+        service.homeworks('token')
+        assert len(requests) == 2
+
+    def test_refresh_goes_through_the_breaker(self, monkeypatch):
+        requests = []
+
+        def fetch_api_answer(token, timestamp):
+            requests.append(current_deadline.get())
+            return {'homeworks': []}
+
+        monkeypatch.setattr(commands, 'fetch_api_answer', fetch_api_answer)
+        breaker = CircuitBreaker('test', failure_threshold=1)
+        service = commands.StatusService(breaker=breaker)
+        assert service.homeworks('token') == []
+        assert requests[0].budget == commands.POLL_DEADLINE
+        breaker.record_failure()
+        with pytest.raises(CircuitOpen):
+            service.refresh('token')
+        assert len(requests) == 1
+
+    def test_engine_keeps_the_cache_current(self, monkeypatch):
+        mock_fetch(monkeypatch, [
+            make_answer(
+                {'homework_name': 'hw2', 'status': 'reviewing'},
+                {'homework_name': 'hw1', 'status': 'approved'},
+            ),
+            make_answer({'homework_name': 'hw2', 'status': 'approved'}),
+        ])
+        monkeypatch.setattr(commands, 'fetch_api_answer', None)
+        subscription = engine.Subscription('token', 1)
+        service = commands.StatusService()
+        polling = engine.PollingEngine(
+            MockBot(), [subscription], status_cache=service.cache
+        )
+
+        async def poll_twice():
+            await polling.poll(subscription)
+            await polling.poll(subscription)
+
+        asyncio.run(poll_twice())
+        assert [
+            (record.name, record.status_name)
+            for record in service.homeworks('token')
+        ] == [('hw2', 'approved'), ('hw1', 'approved')]
+
+    def test_answer_status(self, monkeypatch):
+        monkeypatch.setattr(
+            commands, 'fetch_api_answer',
+            lambda token, timestamp: {'homeworks': [
+                {'homework_name': 'hw2', 'status': 'reviewing'},
+                {'homework_name': 'hw1', 'status': 'approved'},
+            ]}
+        )
+        dispatcher = MockDispatcher()
+        listener = commands.CommandListener(
+            None, [engine.Subscription('token', '42')], dispatcher
+        )
+        listener.answer_status(42)
+        listener.answer_status(43)
+        listener.stop()
+        assert dispatcher.sent == [
+            (42, 'hw2: {}\nhw1: {}'.format(
+                commands.HOMEWORK_VERDICTS['reviewing'],
+                commands.HOMEWORK_VERDICTS['approved'],
+            )),
+            (43, 'You are not subscribed'),
+        ]
+
+
+class TestReportCommand:
+
+    def test_lease_replica_reports_its_own_subscriptions(self):
+        dispatcher = MockDispatcher()
+        listener = commands.CommandListener(
+            None, [engine.Subscription('token', '42')], dispatcher,
+            analytics=ReviewAnalytics(),
+            lease=LeaseKeeper(MemoryLeaseStore(), fair_share=False),
+        )
+        listener.answer_report(42)
+        listener.stop()
+        assert dispatcher.sent[0][1].endswith(
+            'Only the subscriptions polled by this replica are counted'
+        )
+
+
+class UpdatesBot:
+
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def get_updates(self, offset=None, timeout=None, **kwargs):
+        self.calls.append((self.name, timeout))
+        time.sleep(0.01)
+        return []
+
+
+class TestCommandListener:
+
+    def test_one_replica_gets_updates(self):
+        store = MemoryLeaseStore()
+        calls = []
+        listeners = [
+            commands.CommandListener(
+                UpdatesBot(name, calls), [], MockDispatcher(),
+                lease=LeaseKeeper(
+                    store, owner=name, ttl=0.3, fair_share=False
+                ),
+            )
+            for name in ('first', 'second')
+        ]
+        listeners[0].start()
+        time.sleep(0.05)
+        listeners[1].start()
+        time.sleep(0.2)
+        assert {name for name, _ in calls} == {'first'}
+        assert {timeout for _, timeout in calls} == {1}
+        listeners[0].stop()
+        listeners[0].thread.join(5)
+        time.sleep(0.3)
+        listeners[1].stop()
+        assert calls[-1][0] == 'second'
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from api_client import PracticumClient
+import breaker
+from deadline import Deadline, cap_timeout, current_deadline, deadline
+import engine
+from exceptions import DeadlineExceeded
+import homework
+from metrics import DEADLINE_OVERRUNS
+from test_engine import MockBot, MockResponse, make_answer
+
+
+def overruns(stage):
+    return DEADLINE_OVERRUNS.values.get((('stage', stage),), 0)
+
+
+class TestDeadline:
+
+    def test_timeouts_are_capped_by_the_time_left(self):
+        assert cap_timeout((3.05, 30), 'stage') == (3.05, 30)
+        with deadline(10):
+            connect, read = cap_timeout((3.05, 30), 'stage')
+            assert connect == 3.05
+            assert 9 < read <= 10
+            assert 9 < cap_timeout(None, 'stage') <= 10
+        current = Deadline(1, now=0)
+        assert current.check('stage', now=0.5) == 0.5
+        before = overruns('stage')
+        with pytest.raises(DeadlineExceeded):
+            current.check('stage', now=1)
+        assert overruns('stage') == before + 1
+
+    def test_api_request_gets_the_time_left(self, monkeypatch):
+        timeouts = []
+
+        def get(self, url, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            time.sleep(0.1)
+            raise requests.ReadTimeout('read timed out')
+
+        monkeypatch.setattr(requests.Session, 'get', get)
+        monkeypatch.setattr(homework, 'api_client', PracticumClient())
+        before = overruns('get_api_answer')
+        with deadline(0.05):
+            with pytest.raises(DeadlineExceeded):
+                homework.fetch_api_answer('token', 0)
+            with pytest.raises(DeadlineExceeded):
+                homework.fetch_api_answer('token', 0)
+        assert len(timeouts) == 1
+        assert max(timeouts[0]) <= 0.05
+        assert overruns('get_api_answer') == before + 2
+
+    def test_unsent_request_leaves_the_breaker_alone(self, monkeypatch):
+        def fetch_api_response(token, timestamp, validators, stream):
+            cap_timeout(None, 'get_api_answer')
+
+        monkeypatch.setattr(engine, 'fetch_api_response', fetch_api_response)
+        circuit = breaker.CircuitBreaker(
+            'api', failure_threshold=1, recovery_time=0
+        )
+        circuit.record_failure()
+        subscription = engine.Subscription('token', 1)
+        polling = engine.PollingEngine(
+            MockBot(), [subscription], breaker=circuit
+        )
+
+        async def poll():
+            with deadline(0):
+                await polling.poll(subscription)
+
+        asyncio.run(poll())
+        assert circuit.state == breaker.HALF_OPEN
+        assert circuit.probes_in_flight == 0
+
+    def test_engine_stops_the_poll_at_the_deadline(self, monkeypatch):
+        def fetch_api_response(token, timestamp, validators, stream):
+            assert current_deadline.get() is not None
+            time.sleep(0.1)
+            return MockResponse(make_answer(
+                {'homework_name': 'hw1', 'status': 'approved'}
+            ))
+
+        monkeypatch.setattr(engine, 'fetch_api_response', fetch_api_response)
+        bot = MockBot()
+        subscription = engine.Subscription('token', 1)
+        polling = engine.PollingEngine(bot, [subscription])
+
+        async def poll():
+            with deadline(0.05):
+                await polling.poll(subscription)
+
+        asyncio.run(poll())
+        assert bot.sent == []
+        assert subscription.error_count == 1
+        assert subscription.statuses == {}
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import telegram
+
+from dispatcher import TelegramDispatcher, TokenBucket
+
+
+class FloodedBot:
+
+    def __init__(self, floods=1):
+        self.floods = floods
+        self.sent = []
+        self.done = threading.Event()
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        if self.floods:
+            self.floods -= 1
+            raise telegram.error.RetryAfter(0.05)
+        self.sent.append((chat_id, text, time.monotonic()))
+        if len(self.sent) == 4:
+            self.done.set()
+
+
+class TestTokenBucket:
+
+    def test_consume(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        assert bucket.consume(now) == 0
+        assert bucket.consume(now) == 0
+        assert bucket.consume(now) == 0.5
+        assert bucket.consume(now + 0.5) == 0
+
+    def test_set_rate(self):
+        bucket = TokenBucket(rate=2)
+        now = bucket.updated
+        bucket.set_rate(1, now)
+        assert bucket.capacity == 1
+        assert bucket.consume(now) == 0
+        assert bucket.consume(now) == 1
+
+
+class TestTelegramDispatcher:
+
+    def test_delivers_in_order_within_limits(self):
+        bot = FloodedBot()
+        dispatcher = TelegramDispatcher(bot, global_rate=100, chat_rate=20)
+        dispatcher.start()
+        for text in ('a1', 'a2', 'a3'):
+            dispatcher.submit(1, text)
+        dispatcher.submit(2, 'b1')
+        assert bot.done.wait(5)
+        dispatcher.stop()
+        assert [text for chat_id, text, _ in bot.sent if chat_id == 1] == [
+            'a1', 'a2', 'a3'
+        ]
+        chat_times = [at for chat_id, _, at in bot.sent if chat_id == 1]
+        assert chat_times[2] - chat_times[0] >= 0.09
+
+    def test_stop_drains_queued_messages(self):
+        bot = FloodedBot(floods=0)
+        dispatcher = TelegramDispatcher(
+            bot, global_rate=100, chat_rate=50, senders=2, queue_size=2
+        )
+        assert dispatcher.offer(1, 'a1')
+        assert dispatcher.offer(1, 'a2')
+        assert not dispatcher.offer(1, 'a3')
+        dispatcher.start()
+        dispatcher.submit(1, 'a3', timeout=5)
+        dispatcher.submit(2, 'b1', timeout=5)
+        dispatcher.stop(timeout=5)
+        assert [text for _, text, _ in bot.sent if text.startswith('a')] == [
+            'a1', 'a2', 'a3'
+        ]
+        stats = dispatcher.stats()
+        assert stats['delivered'] == 4
+        assert stats['queue_full'] >= 1
+        assert stats['backlog'] == 0
+
+    def test_failed_sends_are_counted_and_survived(self):
+        class FailingBot(FloodedBot):
+
+            def send_message(self, chat_id=None, text=None, **kwargs):
+                if text == 'bad':
+                    raise telegram.error.BadRequest('Chat not found')
+                if text == 'broken':
+                    raise ValueError('Unexpected')
+                super().send_message(chat_id, text, **kwargs)
+
+        bot = FailingBot(floods=0)
+        dispatcher = TelegramDispatcher(bot, global_rate=100, chat_rate=50)
+        dispatcher.start()
+        for text in ('bad', 'broken', 'a1', 'a2'):
+            dispatcher.submit(1, text)
+        dispatcher.stop(timeout=5)
+        assert [text for _, text, _ in bot.sent] == ['a1', 'a2']
+        stats = dispatcher.stats()
+        assert stats['delivered'] == 2
+        assert stats['failed'] == 2
@@ -0,0 +1,253 @@
+import asyncio
+from http import HTTPStatus
+import json
+import os
+
+import engine
+from records import STATUS_CODES
+from scheduler import AdaptiveSchedule
+
+
+class MockBot:
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat_id=None, text=None, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+class MockResponse:
+
+    def __init__(self, data=None, status_code=HTTPStatus.OK, headers=None):
+        self.content = json.dumps(data).encode()
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def make_answer(*homeworks, current_date=100):
+    return {'homeworks': list(homeworks), 'current_date': current_date}
+
+
+def mock_fetch(monkeypatch, answers, requests=None):
+    def fetch_api_response(token, timestamp, validators, stream):
+        if requests is not None:
+            requests.append((token, timestamp, validators))
+        answer = answers[token] if isinstance(answers, dict) else answers.pop(0)
+        if isinstance(answer, MockResponse):
+            return answer
+        return MockResponse(answer)
+
+    monkeypatch.setattr(engine, 'fetch_api_response', fetch_api_response)
+
+
+class TestEngine:
+
+    def test_load_roster(self, tmp_path):
+        roster = tmp_path / 'roster.json'
+        roster.write_text(json.dumps([
+            {'practicum_token': 'a', 'telegram_chat_id': 1},
+            {'practicum_token': 'b', 'telegram_chat_id': 2},
+        ]))
+        subscriptions = engine.load_roster(str(roster))
+        assert [s.chat_id for s in subscriptions] == [1, 2]
+        assert all(s.current_timestamp == 0 for s in subscriptions)
+
+    def test_poll_keeps_state_per_subscription(self, monkeypatch):
+        answers = {
+            'a': make_answer(
+                {'homework_name': 'hw1', 'status': 'reviewing'},
+                current_date=111,
+            ),
+            'b': make_answer(current_date=222),
+        }
+        mock_fetch(monkeypatch, answers)
+        bot = MockBot()
+        first = engine.Subscription('a', 1)
+        second = engine.Subscription('b', 2)
+        polling = engine.PollingEngine(bot, [first, second])
+
+        async def poll_all():
+            await polling.poll(first)
+            await polling.poll(second)
+            await polling.poll(first)
+
+        asyncio.run(poll_all())
+        assert [chat_id for chat_id, _ in bot.sent] == [1, 2]
+        assert first.current_timestamp == 111
+        assert second.current_timestamp == 222
+
+    def test_poll_notifies_every_transition(self, monkeypatch):
+        answers = [
+            make_answer(
+                {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+            ),
+            make_answer(
+                {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+                {'id': 2, 'homework_name': 'hw2', 'status': 'reviewing'},
+                {'id': 3, 'homework_name': 'hw3', 'status': 'rejected'},
+            ),
+        ]
+        mock_fetch(monkeypatch, answers)
+        bot = MockBot()
+        subscription = engine.Subscription('a', 1)
+        polling = engine.PollingEngine(bot, [subscription])
+
+        async def poll_twice():
+            await polling.poll(subscription)
+            await polling.poll(subscription)
+
+        asyncio.run(poll_twice())
+        assert len(bot.sent) == 3
+        assert subscription.statuses == {
+            '1': STATUS_CODES['approved'],
+            '2': STATUS_CODES['reviewing'],
+            '3': STATUS_CODES['rejected'],
+        }
+
+    def test_first_poll_reports_only_the_latest_homework(self, monkeypatch):
+        mock_fetch(monkeypatch, [make_answer(*(
+            {'id': i, 'homework_name': f'hw{i}', 'status': 'approved'}
+            for i in range(20, 0, -1)
+        ))])
+        bot = MockBot()
+        subscription = engine.Subscription('a', 1)
+        polling = engine.PollingEngine(bot, [subscription])
+        asyncio.run(polling.poll(subscription))
+        assert len(bot.sent) == 1
+        assert 'hw20' in bot.sent[0][1]
+        assert len(subscription.statuses) == 20
+        assert subscription.current_timestamp == 100
+
+    def test_failure_is_reported_once_and_readable(self, monkeypatch):
+        mock_fetch(monkeypatch, [{'homeworks': 'secret'}, {'homeworks': 1}])
+        bot = MockBot()
+        subscription = engine.Subscription('secret', 1)
+        polling = engine.PollingEngine(bot, [subscription])
+
+        async def poll_twice():
+            await polling.poll(subscription)
+            await polling.poll(subscription)
+
+        asyncio.run(poll_twice())
+        assert len(bot.sent) == 1
+        message = bot.sent[0][1]
+        assert message.startswith('Failure. Error: ')
+        assert '{}' not in message and 'secret' not in message
+
+    def test_poll_streaming(self, monkeypatch):
+        mock_fetch(monkeypatch, [make_answer(
+            {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'},
+            current_date=333,
+        )])
+        bot = MockBot()
+        subscription = engine.Subscription('a', 1)
+        polling = engine.PollingEngine(bot, [subscription], streaming=True)
+        asyncio.run(polling.poll(subscription))
+        assert len(bot.sent) == 1
+        assert subscription.current_timestamp == 333
+        assert subscription.last_status == 'reviewing'
+
+    def test_streamed_responses_are_always_closed(self, monkeypatch):
+        class ClosingResponse(MockResponse):
+            closed = 0
+
+            def close(self):
+                ClosingResponse.closed += 1
+
+        answers = [
+            ClosingResponse(status_code=HTTPStatus.NOT_MODIFIED),
+            ClosingResponse({'homeworks': 'not a list'}),
+        ]
+        mock_fetch(monkeypatch, answers)
+        subscription = engine.Subscription('a', 1)
+        polling = engine.PollingEngine(
+            MockBot(), [subscription], streaming=True
+        )
+        asyncio.run(polling.poll(subscription))
+        assert ClosingResponse.closed == 1
+        asyncio.run(polling.poll(subscription))
+        assert ClosingResponse.closed >= 2
+        assert subscription.error_count == 1
+
+    def test_unchanged_responses_are_skipped(self, monkeypatch):
+        homework = {'id': 1, 'homework_name': 'hw1', 'status': 'reviewing'}
+        answers = [
+            MockResponse(
+                make_answer(homework, current_date=1),
+                headers={'ETag': '"v1"'},
+            ),
+            MockResponse(make_answer(homework, current_date=2)),
+            MockResponse(status_code=HTTPStatus.NOT_MODIFIED),
+        ]
+        requests = []
+        mock_fetch(monkeypatch, answers, requests)
+        bot = MockBot()
+        subscription = engine.Subscription('a', 1)
+        polling = engine.PollingEngine(bot, [subscription])
+        monkeypatch.setattr(
+            engine, 'diff_statuses',
+            lambda statuses, homeworks: [('1', 'reviewing', 'message')]
+        )
+
+        async def poll_three_times():
+            for _ in range(3):
+                await polling.poll(subscription)
+
+        asyncio.run(poll_three_times())
+        assert len(bot.sent) == 1
+        assert requests[0][2] == {}
+        assert requests[1][2] == {'If-None-Match': '"v1"'}
+
+    def test_roster_changes_are_applied_while_polling(self, monkeypatch,
+                                                      tmp_path):
+        requests = []
+        mock_fetch(monkeypatch, {
+            token: make_answer(current_date=100) for token in 'abc'
+        }, requests)
+        monkeypatch.setattr(engine, 'ROSTER_CHECK_INTERVAL', 0.05)
+        roster = tmp_path / 'roster.json'
+        entries = [
+            {'practicum_token': 'a', 'telegram_chat_id': 1},
+            {'practicum_token': 'b', 'telegram_chat_id': 2},
+        ]
+        roster.write_text(json.dumps(entries))
+        roster_file = engine.RosterFile(str(roster))
+        rosters = []
+        subscriptions = engine.load_roster(str(roster))
+        kept = subscriptions[0]
+        polling = engine.PollingEngine(
+            MockBot(), subscriptions,
+            schedule=AdaptiveSchedule(retry_time=0.02, jitter=0),
+            roster=roster_file, on_roster=rosters.append,
+        )
+
+        async def run():
+            task = asyncio.create_task(polling.run())
+            await asyncio.sleep(0.1)
+            roster.write_text(json.dumps([
+                entries[0], {'practicum_token': 'c', 'telegram_chat_id': 3},
+            ]))
+            os.utime(roster, ns=(0, roster_file.mtime + 1))
+            await asyncio.sleep(0.2)
+            requests.clear()
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(run())
+        assert {token for token, _, _ in requests} == {'a', 'c'}
+        assert polling.by_key[kept.key] is kept
+        assert kept.current_timestamp == 100
+        assert [s.chat_id for s in rosters[-1]] == [1, 3]
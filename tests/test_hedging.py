@@ -0,0 +1,50 @@
+import asyncio
+
+from hedging import Hedger
+
+
+def make_start(latencies, results):
+    """Return `start()` that answers the n-th attempt after latencies[n]."""
+    def start():
+        loop = asyncio.get_running_loop()
+        attempt = loop.create_future()
+        number = len(results)
+        results.append(number)
+        loop.call_later(latencies.pop(0), attempt.set_result, number)
+        return attempt
+    return start
+
+
+class TestHedger:
+
+    def test_slow_request_is_hedged(self):
+        hedger = Hedger(quantile=0.95, rate=100, min_samples=5)
+        discarded = []
+
+        async def run():
+            results = []
+            start = make_start([0.01] * 5 + [1, 0.01], results)
+            for _ in range(5):
+                assert await hedger.call(start) == len(results) - 1
+            assert 0 < hedger.delay() < 0.1
+            winner = await hedger.call(start, discard=discarded.append)
+            await asyncio.sleep(1.1)
+            return winner
+
+        assert asyncio.run(run()) == 6
+        assert discarded == [5]
+
+    def test_hedge_rate_is_capped(self):
+        hedger = Hedger(quantile=0.5, rate=0.001, min_samples=1)
+        hedger.bucket.tokens = 1
+        results = []
+
+        async def run():
+            start = make_start([0.01, 0.2, 0.01, 0.2, 0.01], results)
+            await hedger.call(start)
+            first = await hedger.call(start)
+            second = await hedger.call(start)
+            return first, second
+
+        assert asyncio.run(run()) == (2, 3)
+        assert len(results) == 4
@@ -0,0 +1,83 @@
+import asyncio
+
+import engine
+from history import RECORD, TransitionLog
+from test_engine import MockBot, make_answer, mock_fetch
+
+KEY = 'ab' * 16
+
+
+class TestTransitionLog:
+
+    def test_time_range_and_homework_queries(self, tmp_path):
+        log = TransitionLog(str(tmp_path / 'history.bin'))
+        for minute in range(100):
+            log.append(KEY, f'hw{minute % 10}', 'reviewing', 'approved',
+                       timestamp=minute * 60)
+        assert len(log) == 100
+        found = list(log.between(600, 1200))
+        assert [t.timestamp for t in found] == [
+            minute * 60 for minute in range(10, 20)
+        ]
+        assert found[0].subscription == KEY
+        assert found[0].old_status == 'reviewing'
+        assert found[0].new_status == 'approved'
+        log.build_index()
+        log.append(KEY, 'hw3', 'approved', 'rejected', timestamp=10000)
+        times = [t.timestamp for t in log.for_homework('hw3')]
+        assert times == [minute * 60 for minute in range(3, 100, 10)] + [
+            10000
+        ]
+        log.close()
+
+    def test_compaction_keeps_the_newest_records(self, tmp_path):
+        log = TransitionLog(
+            str(tmp_path / 'history.bin'), retention=1000, max_records=50
+        )
+        for second in range(0, 2000, 10):
+            log.append(KEY, 'hw', None, 'reviewing', timestamp=second)
+        assert log.compact(now=2000) == 150
+        assert len(log) == 50
+        assert [t.timestamp for t in log.between()][0] == 1500
+        assert len(list(log.for_homework('hw'))) == 50
+        log.append(KEY, 'hw', 'reviewing', 'approved')
+        assert len(log) == 51
+        log.close()
+
+    def test_torn_record_is_dropped(self, tmp_path):
+        path = tmp_path / 'history.bin'
+        log = TransitionLog(str(path))
+        log.append(KEY, 'hw', None, 'reviewing', timestamp=1)
+        log.close()
+        with open(path, 'ab') as file:
+            file.write(b'\0' * (RECORD.size // 2))
+        log = TransitionLog(str(path))
+        assert len(log) == 1
+        log.append(KEY, 'hw', 'reviewing', 'approved', timestamp=0)
+        assert [t.timestamp for t in log.between()] == [1, 1]
+        log.close()
+
+    def test_engine_records_transitions(self, monkeypatch, tmp_path):
+        mock_fetch(monkeypatch, [
+            make_answer({'id': 1, 'homework_name': 'hw1',
+                         'status': 'reviewing'}),
+            make_answer({'id': 1, 'homework_name': 'hw1',
+                         'status': 'approved'}),
+        ])
+        log = TransitionLog(str(tmp_path / 'history.bin'))
+        subscription = engine.Subscription('token', 1)
+        polling = engine.PollingEngine(
+            MockBot(), [subscription], history=log
+        )
+
+        async def poll_twice():
+            await polling.poll(subscription)
+            await polling.poll(subscription)
+
+        asyncio.run(poll_twice())
+        transitions = list(log.for_homework('1'))
+        assert [(t.old_status, t.new_status) for t in transitions] == [
+            (None, 'reviewing'), ('reviewing', 'approved')
+        ]
+        assert transitions[0].subscription == subscription.key
+        log.close()
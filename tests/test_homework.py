@@ -0,0 +1,22 @@
+import logging
+
+import pytest
+import requests
+
+import homework
+
+
+class TestRequestApiAnswer:
+
+    def test_token_is_not_logged(self, monkeypatch, caplog):
+        def get(self, url, **kwargs):
+            raise requests.ConnectionError('refused')
+
+        monkeypatch.setattr(requests.Session, 'get', get)
+        caplog.set_level(logging.INFO)
+        with pytest.raises(ConnectionError) as error:
+            homework.fetch_api_answer('secret-token', 0)
+        assert 'secret-token' not in str(error.value)
+        assert 'OAuth ***' in str(error.value)
+        assert 'secret-token' not in caplog.text
+        assert 'OAuth ***' in caplog.text
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import engine
+from leases import (
+    LeaseKeeper,
+    LeaseStore,
+    MemoryLeaseStore,
+    SQLiteLeaseStore,
+)
+from scheduler import AdaptiveSchedule
+from state import StateStore
+from test_engine import MockBot, make_answer, mock_fetch
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        store = MemoryLeaseStore()
+    else:
+        store = SQLiteLeaseStore(str(tmp_path / 'leases.sqlite3'))
+    yield store
+    store.close()
+
+
+class TestLeaseStore:
+
+    def test_store_must_implement_acquire_and_release(self):
+        class AcquireOnly(LeaseStore):
+
+            def acquire(self, keys, owner, ttl, now=None):
+                return set()
+
+        with pytest.raises(TypeError):
+            AcquireOnly()
+
+    def test_lease_is_exclusive_until_it_expires(self, store):
+        assert store.acquire(['a', 'b'], 'one', 10, now=0) == {'a', 'b'}
+        assert store.acquire(['a', 'c'], 'two', 10, now=5) == {'c'}
+        assert store.acquire(['a'], 'one', 10, now=9) == {'a'}
+        assert store.acquire(['a', 'b'], 'two', 10, now=15) == {'b'}
+        assert store.acquire(['a', 'b'], 'two', 10, now=20) == {'a', 'b'}
+
+    def test_released_lease_is_free(self, store):
+        store.acquire(['a'], 'one', 10, now=0)
+        store.release(['a'], 'two')
+        assert store.acquire(['a'], 'two', 10, now=1) == set()
+        store.release(['a'], 'one')
+        assert store.acquire(['a'], 'two', 10, now=1) == {'a'}
+
+    def test_limit_gives_up_the_extra_leases(self, store):
+        keys = ['a', 'b', 'c', 'd']
+        assert store.acquire(keys, 'one', 10, now=0) == set(keys)
+        assert store.acquire(keys, 'two', 10, now=1, limit=2) == set()
+        assert len(store.acquire(keys, 'one', 10, now=2, limit=2)) == 2
+        assert len(store.acquire(keys, 'two', 10, now=3, limit=2)) == 2
+
+    def test_join_counts_live_owners(self, store):
+        assert store.join('one', 10, now=0) == 1
+        assert store.join('two', 10, now=5) == 2
+        assert store.join('two', 10, now=11) == 1
+        store.leave('two')
+        assert store.join('one', 10, now=12) == 1
+
+    def test_sqlite_leases_are_shared_between_connections(self, tmp_path):
+        path = str(tmp_path / 'leases.sqlite3')
+        first, second = SQLiteLeaseStore(path), SQLiteLeaseStore(path)
+        assert first.acquire(['a'], 'one', 10, now=0) == {'a'}
+        assert second.acquire(['a'], 'two', 10, now=1) == set()
+        first.close()
+        second.close()
+
+
+class TestLeaseKeeper:
+
+    def test_replicas_split_the_keys(self, store):
+        keys = [str(i) for i in range(100)]
+        keepers = [LeaseKeeper(store, owner=owner) for owner in ('a', 'b')]
+        for _ in range(3):
+            for keeper in keepers:
+                keeper.refresh(keys)
+        held = [set(keeper.deadlines) for keeper in keepers]
+        assert [len(keys) for keys in held] == [50, 50]
+        assert held[0].isdisjoint(held[1])
+
+    def test_only_one_replica_polls_a_subscription(self, monkeypatch,
+                                                   tmp_path):
+        requests = []
+        mock_fetch(
+            monkeypatch, {'a': make_answer(), 'b': make_answer()}, requests
+        )
+        store = MemoryLeaseStore()
+        state_file = str(tmp_path / 'state.sqlite3')
+        schedule = AdaptiveSchedule(
+            retry_time=0.01, reviewing_retry_time=0.01, jitter=0
+        )
+        replicas = [
+            engine.PollingEngine(
+                MockBot(),
+                [engine.Subscription('a', 1), engine.Subscription('b', 2)],
+                schedule=schedule,
+                store=StateStore(state_file),
+                leases=LeaseKeeper(store, owner=owner, ttl=0.3),
+            )
+            for owner in ('one', 'two')
+        ]
+
+        async def run_replicas():
+            tasks = [
+                asyncio.create_task(replica.run()) for replica in replicas
+            ]
+            await asyncio.sleep(0.1)
+            tasks[0].cancel()
+            await asyncio.sleep(0.1)
+            polled = len(requests)
+            await asyncio.sleep(0.2)
+            assert len(requests) > polled, 'The leases have failed over'
+            tasks[1].cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run(run_replicas())
+        first, second = (replica.bot.sent for replica in replicas)
+        assert sorted(first + second) == [(1, 'There is no homework'),
+                                          (2, 'There is no homework')]
@@ -0,0 +1,22 @@
+import logging
+
+import logs
+
+
+class TestLogging:
+
+    def test_records_are_written_by_the_listener(self, tmp_path):
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        path = tmp_path / 'main.log'
+        try:
+            listener = logs.setup_logging(path=str(path))
+            assert [type(handler) for handler in root.handlers] == [
+                logs.LazyQueueHandler
+            ]
+            logging.getLogger('homework').info('Work status %s', 'approved')
+            listener.stop()
+        finally:
+            root.handlers[:] = saved_handlers
+            root.setLevel(saved_level)
+        assert 'INFO, Work status approved, homework,' in path.read_text()
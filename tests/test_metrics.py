@@ -0,0 +1,46 @@
+from urllib.request import urlopen
+
+import pytest
+
+import metrics
+
+
+class TestMetrics:
+
+    def test_render_prometheus_text(self):
+        registry = metrics.Registry()
+        counter = registry.counter('polls_total', 'Polls.')
+        histogram = registry.histogram(
+            'stage_seconds', 'Stages.', buckets=(0.1, 1)
+        )
+        counter.inc(outcome='changed')
+        counter.inc(2, outcome='changed')
+        histogram.observe(0.05, stage='parse')
+        histogram.observe(0.5, stage='parse')
+        histogram.observe(5, stage='parse')
+        lines = registry.render().splitlines()
+        assert '# TYPE polls_total counter' in lines
+        assert 'polls_total{outcome="changed"} 3' in lines
+        assert 'stage_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+        assert 'stage_seconds_bucket{stage="parse",le="1"} 2' in lines
+        assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+        assert 'stage_seconds_count{stage="parse"} 3' in lines
+        assert 'stage_seconds_sum{stage="parse"} 5.55' in lines
+
+    def test_stage_counts_errors(self):
+        with pytest.raises(KeyError):
+            with metrics.stage('test_stage'):
+                raise KeyError('homework_name')
+        assert metrics.ERRORS.values[
+            (('error', 'KeyError'), ('stage', 'test_stage'))
+        ] == 1
+
+    def test_server(self):
+        server = metrics.start_metrics_server(port=0)
+        try:
+            port = server.server_address[1]
+            with urlopen(f'http://127.0.0.1:{port}/metrics') as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+        assert '# TYPE homework_bot_stage_seconds histogram' in body
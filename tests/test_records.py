@@ -0,0 +1,47 @@
+import engine
+from records import (
+    STATUS_CODES,
+    HomeworkRecord,
+    bytes_per_subscription,
+    deep_sizeof,
+)
+
+
+class TestRecords:
+
+    def test_homework_record(self):
+        record = HomeworkRecord.from_json(
+            {'id': 1, 'homework_name': 'hw1', 'status': 'approved'}
+        )
+        assert record.status == STATUS_CODES['approved']
+        assert record.status_name == 'approved'
+        assert not hasattr(record, '__dict__')
+        unknown = HomeworkRecord.from_json(
+            {'homework_name': 'hw1', 'status': 'lost'}
+        )
+        assert unknown.status_name == 'lost'
+
+    def test_homework_keys_are_interned(self):
+        first = engine.homework_key({'id': 12345})
+        second = engine.homework_key({'id': 12345})
+        assert first is second
+
+    def test_shared_objects_are_counted_once(self):
+        shared = 'x' * 1000
+        assert deep_sizeof([shared, shared]) < 2 * len(shared)
+        seen = set()
+        deep_sizeof(shared, seen)
+        assert deep_sizeof([shared], seen) < len(shared)
+
+    def test_bytes_per_subscription(self):
+        subscriptions = [
+            engine.Subscription(f'token-{i}', i) for i in range(100)
+        ]
+        for subscription in subscriptions:
+            subscription.statuses = {
+                engine.homework_key({'id': n}): STATUS_CODES['approved']
+                for n in range(10)
+            }
+        assert not hasattr(subscriptions[0], '__dict__')
+        size = bytes_per_subscription(subscriptions)
+        assert 0 < size < 2048
@@ -0,0 +1,75 @@
+import gzip
+
+import pytest
+import requests
+
+from replay import RecordingClient, ReplayClient, load_capture
+
+
+class MockResponse:
+    status_code = 200
+    reason = 'OK'
+    headers = {'Content-Type': 'application/json', 'ETag': '"v1"'}
+
+    def __init__(self, body):
+        self.content = body
+
+
+class MockClient:
+
+    def __init__(self):
+        self.answers = [
+            MockResponse(b'{"homeworks": [], "current_date": 1}'),
+            requests.Timeout('read timeout'),
+            MockResponse(b'{"homeworks": [], "current_date": 2}'),
+        ]
+
+    def get(self, url, **kwargs):
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def close(self):
+        pass
+
+
+class TestRecordReplay:
+    url = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
+    headers = {'Authorization': 'OAuth secret'}
+
+    def record(self, path):
+        recorder = RecordingClient(MockClient(), path)
+        recorder.get(self.url, headers=self.headers,
+                     params={'from_date': 0})
+        with pytest.raises(requests.Timeout):
+            recorder.get(self.url, headers=self.headers,
+                         params={'from_date': 1})
+        recorder.get(self.url, headers=self.headers,
+                     params={'from_date': 1})
+        recorder.close()
+
+    def test_capture_does_not_contain_tokens(self, tmp_path):
+        path = tmp_path / 'capture.jsonl.gz'
+        self.record(str(path))
+        text = gzip.decompress(path.read_bytes()).decode()
+        assert 'secret' not in text
+        assert [record['from_date'] for record in load_capture(str(path))] == [
+            0, 1, 1
+        ]
+
+    def test_replay(self, tmp_path):
+        path = str(tmp_path / 'capture.jsonl.gz')
+        self.record(path)
+        client = ReplayClient(path, speed=0, loop=False)
+        first = client.get(self.url, headers=self.headers)
+        assert first.json() == {'homeworks': [], 'current_date': 1}
+        assert first.headers['etag'] == '"v1"'
+        with pytest.raises(requests.ConnectionError):
+            client.get(self.url, headers=self.headers)
+        third = client.get(self.url, headers=self.headers)
+        assert b''.join(third.iter_content(4)) == third.content
+        with pytest.raises(requests.ConnectionError):
+            client.get(self.url, headers=self.headers)
+        with pytest.raises(requests.ConnectionError):
+            client.get(self.url, headers={'Authorization': 'OAuth other'})
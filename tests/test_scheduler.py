@@ -0,0 +1,90 @@
+import engine
+from scheduler import AdaptiveSchedule, PollQueue
+
+
+class TestAdaptiveSchedule:
+    schedule = AdaptiveSchedule(
+        retry_time=600, reviewing_retry_time=120, idle_retry_time=1800,
+        idle_after=3600, error_retry_time=30, max_error_retry_time=300,
+        jitter=0.1,
+    )
+
+    def make_subscription(self, status=None, errors=0, last_change=0):
+        subscription = engine.Subscription('token', 1)
+        subscription.last_status = status
+        subscription.error_count = errors
+        subscription.last_change = last_change
+        return subscription
+
+    def test_reviewing_is_polled_sooner(self):
+        subscription = self.make_subscription('reviewing')
+        assert self.schedule.base_delay(subscription, now=10) == 120
+
+    def test_terminal_and_idle_back_off(self):
+        approved = self.make_subscription('approved')
+        assert self.schedule.base_delay(approved, now=10) == 1800
+        idle = self.make_subscription('rejected')
+        assert self.schedule.base_delay(idle, now=10) == 600
+        assert self.schedule.base_delay(idle, now=3600) == 1800
+
+    def test_errors_back_off_exponentially(self):
+        delays = [
+            self.schedule.base_delay(
+                self.make_subscription('reviewing', errors), now=10
+            )
+            for errors in range(1, 6)
+        ]
+        assert delays == [30, 60, 120, 240, 300]
+
+    def test_jitter(self):
+        subscription = self.make_subscription('reviewing')
+        for _ in range(100):
+            assert 108 <= self.schedule.next_delay(subscription, now=10) <= 132
+
+
+class TestPollQueue:
+
+    def test_pops_in_due_order(self):
+        queue = PollQueue()
+        for item, due in (('a', 3), ('b', 1), ('c', 2)):
+            queue.push(item, due)
+        assert queue.pop_due(now=0) is None
+        assert queue.pop_due(now=10) == ('b', 1)
+        assert queue.pop_due(now=10) == ('c', 2)
+        assert queue.pop_due(now=10) == ('a', 3)
+        assert queue.pop_due(now=10) is None
+
+    def test_reschedule_replaces_the_due_time(self):
+        queue = PollQueue()
+        queue.push('a', 1)
+        queue.push('b', 2)
+        queue.push('a', 5)
+        assert len(queue) == 2
+        assert queue.peek() == 2
+        assert queue.pop_due(now=10) == ('b', 2)
+        assert queue.pop_due(now=10) == ('a', 5)
+
+    def test_removed_entries_are_compacted(self):
+        queue = PollQueue()
+        for round in range(100):
+            for item in range(10):
+                queue.push(item, round)
+        assert len(queue) == 10
+        assert len(queue.heap) <= 2 * len(queue) + 1
+        queue.remove(3)
+        assert 3 not in queue
+        assert sorted(
+            queue.pop_due(now=100)[0] for _ in range(9)
+        ) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+    def test_first_polls_are_spread(self):
+        schedule = AdaptiveSchedule(retry_time=600)
+        delays = sorted(
+            schedule.first_delay(engine.Subscription(f'token-{i}', i))
+            for i in range(1000)
+        )
+        assert 0 <= delays[0] and delays[-1] < 600
+        buckets = [0] * 10
+        for delay in delays:
+            buckets[int(delay // 60)] += 1
+        assert min(buckets) > 50
@@ -0,0 +1,40 @@
+import engine
+from records import STATUS_CODES
+from state import StateStore
+
+APPROVED = STATUS_CODES['approved']
+REVIEWING = STATUS_CODES['reviewing']
+
+
+class TestStateStore:
+
+    def test_state_survives_restart(self, tmp_path):
+        path = str(tmp_path / 'state.sqlite3')
+        subscription = engine.Subscription('token', 1)
+        subscription.current_timestamp = 1000198000
+        subscription.previous_report = 'hello'
+        store = StateStore(path)
+        store.save(subscription)
+        store.close()
+
+        restored = engine.Subscription('token', 1)
+        other = engine.Subscription('token', 2)
+        store = StateStore(path)
+        assert store.load(restored)
+        assert not store.load(other)
+        store.close()
+        assert restored.current_timestamp == 1000198000
+        assert restored.previous_report == 'hello'
+        assert other.current_timestamp == 0
+
+    def test_homework_statuses_are_restored(self, tmp_path):
+        path = str(tmp_path / 'state.sqlite3')
+        subscription = engine.Subscription('token', 1)
+        store = StateStore(path)
+        store.save(subscription, [('1', REVIEWING, 'message')])
+        store.save(subscription, [('1', APPROVED, 'message')])
+        store.save(subscription, [('2', REVIEWING, 'message')])
+        restored = engine.Subscription('token', 1)
+        assert store.load(restored)
+        store.close()
+        assert restored.statuses == {'1': APPROVED, '2': REVIEWING}
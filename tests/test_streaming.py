@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from exceptions import EmptyAPIReply
+from streaming import HomeworkStream
+
+
+def chunked(data, size):
+    body = json.dumps(data, ensure_ascii=False).encode()
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class TestHomeworkStream:
+    answer = {
+        'homeworks': [
+            {'id': 2, 'homework_name': 'Итоговый проект', 'status': 'reviewing'},
+            {'id': 1, 'homework_name': 'hw1', 'status': 'approved'},
+        ],
+        'current_date': 1000198991,
+    }
+
+    @pytest.mark.parametrize('size', [1, 3, 7, 1024])
+    def test_yields_homeworks(self, size):
+        stream = HomeworkStream(chunked(self.answer, size))
+        assert list(stream) == self.answer['homeworks']
+        assert stream.current_date == 1000198991
+        assert stream.first == self.answer['homeworks'][0]
+        assert stream.count == 2
+
+    def test_closes_the_response(self):
+        closed = []
+        stream = HomeworkStream(
+            chunked(self.answer, 5), close=lambda: closed.append(True)
+        )
+        list(stream)
+        assert closed == [True]
+
+    @pytest.mark.parametrize('data, error', [
+        ([], TypeError),
+        ({}, EmptyAPIReply),
+        ({'current_date': 1}, EmptyAPIReply),
+        ({'homeworks': {'status': 'approved'}}, KeyError),
+        ({'homeworks': [1]}, TypeError),
+    ])
+    def test_checks_the_shape(self, data, error):
+        with pytest.raises(error):
+            list(HomeworkStream(chunked(data, 2)))
+
+    def test_truncated_body(self):
+        chunks = chunked(self.answer, 4)[:-3]
+        with pytest.raises(ValueError):
+            list(HomeworkStream(chunks))
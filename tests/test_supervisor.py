@@ -0,0 +1,193 @@
+import json
+import multiprocessing
+import os
+import time
+
+from dispatcher import TelegramDispatcher
+import engine
+from records import STATUS_CODES, HomeworkRecord
+import supervisor
+
+FORK = multiprocessing.get_context('fork')
+SHARDS_DIR = None
+
+
+def sleep_worker(index, entries, workers, connection=None):
+    time.sleep(60)
+
+
+def exit_worker(index, entries, workers, connection=None):
+    pass
+
+
+def echo_worker(index, entries, workers, connection=None):
+    """Write every message the worker gets to `SHARDS_DIR/index`."""
+    message = ('shard', entries)
+    while True:
+        with open(os.path.join(SHARDS_DIR, str(index)), 'a') as file:
+            file.write(json.dumps(message) + '\n')
+        message = connection.recv()
+
+
+def make_subscriptions(count):
+    return [engine.Subscription(f'token-{i}', i) for i in range(count)]
+
+
+class TestHashRing:
+
+    def test_adding_a_worker_moves_only_its_keys(self):
+        keys = [engine.Subscription(f't{i}', i).key for i in range(2000)]
+        before = supervisor.HashRing(range(4))
+        after = supervisor.HashRing(range(5))
+        moved = [
+            key for key in keys
+            if before.node_for(key) != after.node_for(key)
+        ]
+        assert all(after.node_for(key) == 4 for key in moved)
+        assert 0.1 < len(moved) / len(keys) < 0.35
+
+    def test_shards_cover_the_roster(self):
+        subscriptions = make_subscriptions(100)
+        shards = supervisor.shard_roster(subscriptions, 3)
+        entries = [entry for shard in shards for entry in shard]
+        assert sorted(entries) == sorted(
+            (s.practicum_token, s.chat_id) for s in subscriptions
+        )
+        assert all(shards)
+
+
+class TestSupervisor:
+
+    def test_rebalance_restarts_only_changed_workers(self):
+        sup = supervisor.Supervisor(
+            make_subscriptions(50), 3, roster_path=None,
+            target=sleep_worker, context=FORK,
+        )
+        try:
+            sup.rebalance(sup.subscriptions, 3)
+            assert sup.alive == 3
+            pids = {slot.index: slot.process.pid for slot in sup.slots}
+            sup.rebalance(list(reversed(sup.subscriptions)), 3)
+            assert {s.index: s.process.pid for s in sup.slots} == pids
+            sup.rebalance(sup.subscriptions, 4)
+            assert sup.alive == 4
+        finally:
+            sup.stop_slots(sup.slots)
+        assert sup.alive == 0
+
+    def test_kept_workers_get_the_new_rates(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(globals(), 'SHARDS_DIR', str(tmp_path))
+        sup = supervisor.Supervisor(
+            make_subscriptions(50), 3, roster_path=None,
+            target=echo_worker, context=FORK,
+        )
+        sup.dispatcher = TelegramDispatcher(None, global_rate=10)
+        try:
+            sup.rebalance(sup.subscriptions, 3)
+            pids = [slot.process.pid for slot in sup.slots]
+            sup.rebalance(sup.subscriptions, 2)
+            assert [slot.process.pid for slot in sup.slots] == pids[:2]
+            time.sleep(0.5)
+            for slot in sup.slots:
+                messages = [
+                    json.loads(line) for line in
+                    (tmp_path / str(slot.index)).read_text().splitlines()
+                ]
+                assert messages[1] == [
+                    'rates', supervisor.TELEGRAM_GLOBAL_RATE / 3,
+                    supervisor.HEDGE_RATE / 2,
+                ]
+                assert sorted(map(tuple, messages[-1][1])) == sorted(
+                    slot.entries
+                )
+            assert sup.dispatcher.global_bucket.rate == (
+                supervisor.TELEGRAM_GLOBAL_RATE / 3
+            )
+        finally:
+            sup.stop_slots(sup.slots)
+
+    def test_worker_applies_the_rates_it_receives(self):
+        worker, connection = FORK.Pipe()
+        receiver = supervisor.ShardReceiver(worker)
+        dispatcher = TelegramDispatcher(None, global_rate=10)
+        polling = engine.PollingEngine(None, [], dispatcher=dispatcher)
+        receiver.on_rates = polling.set_rates
+        connection.send(('rates', 5, 0.5))
+        connection.send(('shard', (('token', 1),)))
+        subscriptions = receiver.reload()
+        assert [s.chat_id for s in subscriptions] == [1]
+        assert dispatcher.global_bucket.rate == 5
+
+    def test_worker_updates_reach_the_supervisor(self):
+        sup = supervisor.Supervisor(
+            make_subscriptions(1), 1, roster_path=None, context=FORK,
+        )
+        slot = supervisor.WorkerSlot(0, ())
+        worker, slot.connection = FORK.Pipe()
+        sup.slots = [slot]
+        link = supervisor.SupervisorLink(worker)
+        cache = supervisor.ForwardingStatusCache(link)
+        cache.update('token', [HomeworkRecord('hw1', 1)], snapshot=True)
+        cache.touch('token')
+        supervisor.ForwardingAnalytics(link).observe(
+            'key', [('hw1', None, STATUS_CODES['approved'])], snapshot=True
+        )
+        sup.collect_updates()
+        assert sup.analytics.report()['approved'] == 1
+        assert [
+            (record.name, record.status)
+            for record in sup.status_cache.get('token')
+        ] == [('hw1', 1)]
+
+    def test_dead_workers_are_restarted_with_backoff(self):
+        sup = supervisor.Supervisor(
+            make_subscriptions(10), 1, roster_path=None,
+            target=exit_worker, context=FORK,
+        )
+        sup.rebalance(sup.subscriptions, 1)
+        slot = sup.slots[0]
+        slot.process.join(5)
+        now = time.monotonic()
+        sup.check_workers(now)
+        assert slot.process is None
+        assert slot.restart_at == now + supervisor.RESTART_BACKOFF
+        sup.check_workers(now + supervisor.RESTART_BACKOFF)
+        assert slot.process is not None
+        slot.process.join(5)
+        sup.check_workers(now + supervisor.RESTART_BACKOFF)
+        assert slot.failures == 2
+        sup.stop_slots(sup.slots)
+
+    def test_roster_change_is_sent_to_running_workers(self, tmp_path,
+                                                      monkeypatch):
+        monkeypatch.setitem(globals(), 'SHARDS_DIR', str(tmp_path))
+        roster = tmp_path / 'roster.json'
+        entries = [
+            {'practicum_token': f'token-{i}', 'telegram_chat_id': i + 1}
+            for i in range(20)
+        ]
+        roster.write_text(json.dumps(entries[:10]))
+        sup = supervisor.Supervisor(
+            engine.load_roster(str(roster)), 2, roster_path=str(roster),
+            target=echo_worker, context=FORK,
+        )
+        try:
+            sup.rebalance(sup.subscriptions, 2)
+            pids = [slot.process.pid for slot in sup.slots]
+            roster.write_text(json.dumps(entries[5:]))
+            os.utime(roster, ns=(0, sup.roster.mtime + 1))
+            sup.reload_roster()
+            assert len(sup.subscriptions) == 15
+            assert [slot.process.pid for slot in sup.slots] == pids
+            time.sleep(0.5)
+            received = set()
+            for slot in sup.slots:
+                shards = (tmp_path / str(slot.index)).read_text().split('\n')
+                assert len(shards) == 3
+                received.update(
+                    token for token, _ in json.loads(shards[-2])[1]
+                )
+            assert received == {entry['practicum_token']
+                                for entry in entries[5:]}
+        finally:
+            sup.stop_slots(sup.slots)